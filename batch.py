@@ -0,0 +1,159 @@
+import argparse
+import functools
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections.abc import Iterator
+
+import canon
+import corpus
+import main
+from grid import FlatGrid
+
+
+def make_record(seed: int, difficulty: str, fmt: str, index: int) -> bytes:
+    # Each puzzle gets its own seed, so the output does not depend on the
+    # number of workers and an interrupted run resumes where it stopped.
+    random.seed(f'{seed}:{index}')
+    puzzle, solution = main.new_game(difficulty)
+    return corpus.encode(puzzle, solution, fmt)
+
+
+def make_keyed_record(
+    seed: int, difficulty: str, fmt: str, index: int
+) -> tuple[bytes, bytes]:
+    # The canonical key is computed in the worker, so deduplication costs
+    # the parent one set lookup per record.
+    record = make_record(seed, difficulty, fmt, index)
+    return record_key(record, fmt), record
+
+
+def record_key(record: bytes, fmt: str) -> bytes:
+    table = corpus.FROM_DIGITS if fmt == 'digits' else corpus.HIGH_NIBBLE
+    puzzle = FlatGrid(record[:81].translate(table))
+    found = canon.canonical(puzzle)
+    return bytes(puzzle.cells) if found is None else found[0]
+
+
+def generate(
+    path: str,
+    count: int,
+    fmt: str = 'packed',
+    difficulty: str = 'beginner',
+    seed: int = 0,
+    workers: int | None = None,
+    chunksize: int = 16,
+    dedup: bool = False,
+) -> float:
+    done = corpus.record_count(path, fmt)
+    if os.path.exists(path):
+        # drop a record left half-written by an interrupted run
+        os.truncate(path, done * corpus.RECORD_SIZE[fmt])
+    if done >= count:
+        return 0.0
+
+    # With dedup, puzzles equivalent to one already in the file (under
+    # relabelling, row/column/band/stack permutations and transposition)
+    # are skipped and more seeds are drawn. A resumed run starts again at
+    # seed index `done` and skips what it regenerates.
+    seen: set[bytes] = set()
+    if dedup and done:
+        with open(path, 'rb') as existing:
+            data = existing.read()
+        size = corpus.RECORD_SIZE[fmt]
+        seen = {record_key(data[k : k + size], fmt) for k in range(0, len(data), size)}
+    keyed = functools.partial(make_keyed_record, seed, difficulty, fmt)
+    plain = functools.partial(make_record, seed, difficulty, fmt)
+    start = last = time.perf_counter()
+    written = skipped = 0
+    index = done
+    with (
+        open(path, 'ab') as out,
+        multiprocessing.Pool(workers) as pool,
+    ):
+        while written < count - done:
+            # with dedup, a batch too small to tell a few unlucky repeats
+            # from a generator out of distinct puzzles is padded
+            remaining = count - done - written
+            batch = range(
+                index, index + (max(remaining, chunksize) if dedup else remaining)
+            )
+            index = batch.stop
+            added = 0
+            results: Iterator[tuple[bytes, bytes]]
+            if dedup:
+                results = pool.imap(keyed, batch, chunksize)
+            else:
+                results = ((b'', r) for r in pool.imap(plain, batch, chunksize))
+            for key, record in results:
+                if written == count - done:
+                    break
+                if dedup:
+                    if key in seen:
+                        skipped += 1
+                        continue
+                    seen.add(key)
+                out.write(record)
+                written += 1
+                added += 1
+                now = time.perf_counter()
+                if now - last >= 1:
+                    last = now
+                    out.flush()
+                    print(
+                        f'{done + written}/{count} puzzles, '
+                        f'{written / (now - start):.1f} puzzles/s',
+                        file=sys.stderr,
+                    )
+            out.flush()
+            if not added:
+                # e.g. --seeds with fewer distinct seeds than count
+                raise ValueError(
+                    f'{len(batch)} puzzles in a row were all equivalent to ones '
+                    f'already written; stopping at {done + written}/{count}'
+                )
+
+    if dedup:
+        print(f'{skipped} equivalent puzzles skipped')
+    rate = (count - done) / (time.perf_counter() - start)
+    print(f'{count - done} puzzles written to {path}, {rate:.1f} puzzles/s')
+    return rate
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a puzzle corpus.')
+    parser.add_argument('path')
+    parser.add_argument('count', type=int)
+    parser.add_argument('--format', choices=corpus.RECORD_SIZE, default='packed')
+    parser.add_argument(
+        '--difficulty', choices=main.DIFFICULTY_CLUES, default='beginner'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=16)
+    parser.add_argument(
+        '--seeds', help='derive puzzles from this packed corpus instead of generating'
+    )
+    parser.add_argument(
+        '--dedup', action='store_true', help='skip puzzles equivalent to one kept'
+    )
+    args = parser.parse_args()
+
+    if args.seeds:
+        # inherited by the forked workers
+        main.puzzle_seeds = main.load_seeds(args.seeds)
+    try:
+        generate(
+            args.path,
+            args.count,
+            fmt=args.format,
+            difficulty=args.difficulty,
+            seed=args.seed,
+            workers=args.workers,
+            chunksize=args.chunksize,
+            dedup=args.dedup,
+        )
+    except ValueError as e:
+        sys.exit(f'batch.py: {e}')
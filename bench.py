@@ -0,0 +1,434 @@
+import argparse
+import functools
+import http.client
+import json
+import multiprocessing
+import multiprocessing.pool
+import platform
+import random
+import re
+import socket
+import statistics
+import threading
+import time
+import timeit
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+import htinter as ht
+import main
+from canon import SolutionCache, random_transform
+from grid import FlatGrid
+
+# Hand-picked inputs that hurt at least one engine: a puzzle built against
+# row-major backtracking, the usual "hardest" newspaper puzzle, a minimal
+# unsolvable one, a grid with many solutions and an empty grid.
+PATHOLOGICAL = {
+    'anti-backtracking': '..............3.85..1.2.......5.7.....4...1...9.......5......73..2.1........4...9',
+    'inkala': '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..',
+    'unsolvable': '.....5.8....6.1.43..........1.5........1.6...3.......553.....61........4.........',
+    'many-solutions': '.....6....59.....82....8....45........3........6..3.54...325..6..................',
+    'empty': '.' * 81,
+}
+
+
+# The query parsing shipped before the one-pass rewrite, kept as the
+# baseline the rewrite is measured and checked against.
+def legacy_pourcent_dec_get(burl: bytes) -> str:
+    res = b''
+    k = 0
+    while k < len(burl):
+        if burl[k] == b'%'[0]:
+            if int(burl[k + 1 : k + 3], 16) in [0x3D, 0x26, 0x25]:
+                res = res + burl[k : k + 3]
+            else:
+                res = res + bytes([int(burl[k + 1 : k + 3], 16)])
+            k = k + 3
+        else:
+            res = res + bytes([burl[k]])
+            k = k + 1
+    return str(res, 'utf-8')
+
+
+def legacy_extraire(url: str) -> dict[str, str]:
+    res = {}
+    for aff in url.split('&'):
+        if '=' in aff:
+            c, v = aff.split('=', 1)
+        else:
+            c = aff
+            v = ''
+        c = (
+            c.replace('%3D', '=')
+            .replace('%3d', '=')
+            .replace('%26', '&')
+            .replace('%25', '%')
+        )
+        v = (
+            v.replace('%3D', '=')
+            .replace('%3d', '=')
+            .replace('%26', '&')
+            .replace('%25', '%')
+        )
+        res[c] = v
+    return res
+
+
+def legacy_query(query: bytes) -> dict[str, str]:
+    return legacy_extraire(legacy_pourcent_dec_get(query))
+
+
+def click_query(attributes: int) -> bytes:
+    # What capture_clic sends: the selector, then every attribute of the
+    # clicked element, percent-encoded by the browser.
+    params = ['objet=.cell%5Bx%3D%224%22%5D', 'class=cell%20active']
+    params += [f'data-{k}=valeur%20%C3%A9%3D{k}%26{k}' for k in range(attributes)]
+    return '&'.join(params).encode()
+
+
+def bench(stmt: Callable[[], object], repeat: int, number: int) -> float:
+    return min(timeit.repeat(stmt, repeat=repeat, number=number)) / number
+
+
+def summary(samples: list[float]) -> dict[str, Any]:
+    # Seconds in, milliseconds out.
+    if not samples:
+        return {'count': 0}
+    ms = sorted(x * 1e3 for x in samples)
+    p95 = p99 = ms[0]
+    if len(ms) > 1:
+        q = statistics.quantiles(ms, n=100, method='inclusive')
+        p95, p99 = q[94], q[98]
+    return {
+        'count': len(ms),
+        'median_ms': statistics.median(ms),
+        'p95_ms': p95,
+        'p99_ms': p99,
+        'max_ms': ms[-1],
+    }
+
+
+def show(name: str, result: dict[str, Any]) -> None:
+    if not result['count']:
+        print(f'{name:<32} no samples')
+        return
+    print(
+        f'{name:<32} n={result["count"]:<4} median {result["median_ms"]:9.3f} ms'
+        f'  p95 {result["p95_ms"]:9.3f}  p99 {result["p99_ms"]:9.3f}'
+        + (f'  peak {result["peak_kib"]:8.1f} KiB' if 'peak_kib' in result else '')
+    )
+
+
+def parse(puzzle: str) -> FlatGrid:
+    return FlatGrid(0 if c == '.' else int(c) for c in puzzle)
+
+
+def dataset(seed: int, count: int) -> dict[str, dict[str, bytes]]:
+    # Every puzzle is seeded on its own, so a run with a larger count
+    # extends the same lists instead of drawing new ones.
+    sets: dict[str, dict[str, bytes]] = {}
+    for name, difficulty in (('easy', 'beginner'), ('hard', 'advanced')):
+        sets[name] = {}
+        for k in range(count):
+            random.seed(f'{seed}:{difficulty}:{k}')
+            puzzle, _ = main.new_game(difficulty)
+            sets[name][f'{name}-{k}'] = bytes(puzzle.cells)
+    sets['pathological'] = {
+        label: bytes(parse(puzzle).cells) for label, puzzle in PATHOLOGICAL.items()
+    }
+    return sets
+
+
+def time_solve(engine: str, cells: bytes) -> tuple[float, int, bool]:
+    # Runs in a worker process. The peak memory comes from a second run,
+    # since tracemalloc slows the solver down too much to time it.
+    grid = FlatGrid(cells)
+    start = time.perf_counter()
+    solved = main.solve_sudoku(grid, engine)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    main.solve_sudoku(FlatGrid(cells), engine)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, solved
+
+
+def bench_solvers(
+    sets: dict[str, dict[str, bytes]], engines: list[str], timeout: float
+) -> dict[str, Any]:
+    # Each solve runs in a child process so a pathological puzzle can be
+    # abandoned after timeout seconds instead of stalling the whole run.
+    results: dict[str, Any] = {}
+    pool = multiprocessing.Pool(1)
+    try:
+        for engine in engines:
+            for name, puzzles in sets.items():
+                times, peaks, solved, timed_out = [], [], 0, []
+                for label, cells in puzzles.items():
+                    job = pool.apply_async(time_solve, (engine, cells))
+                    try:
+                        elapsed, peak, ok = job.get(timeout)
+                    except multiprocessing.TimeoutError:
+                        timed_out.append(label)
+                        pool.terminate()
+                        pool = multiprocessing.Pool(1)
+                        continue
+                    times.append(elapsed)
+                    peaks.append(peak)
+                    solved += ok
+                result = summary(times)
+                result.update(solved=solved, timed_out=timed_out)
+                if peaks:
+                    result['peak_kib'] = max(peaks) / 1024
+                results[f'{engine}/{name}'] = result
+                show(f'solve {engine}/{name}', result)
+                if timed_out:
+                    print(
+                        f'{"":<32} timed out after {timeout} s: {", ".join(timed_out)}'
+                    )
+    finally:
+        pool.terminate()
+    return results
+
+
+def variant(cells: bytes, rnd: random.Random) -> FlatGrid:
+    # A random symmetric copy: bands, rows, stacks and columns shuffled,
+    # digits relabelled, maybe transposed.
+    return FlatGrid(random_transform(rnd).apply(cells))
+
+
+def bench_cache(
+    sets: dict[str, dict[str, bytes]], seed: int, variants: int
+) -> dict[str, Any]:
+    # Replays `variants` symmetric copies of every easy and hard puzzle in
+    # random order, solved directly and through the canonical-form cache.
+    rnd = random.Random(seed)
+    results: dict[str, Any] = {}
+    for name in ('easy', 'hard'):
+        stream = [
+            variant(cells, rnd)
+            for cells in sets[name].values()
+            for _ in range(variants)
+        ]
+        rnd.shuffle(stream)
+        cache = SolutionCache(main.solve_sudoku)
+        direct, cached = [], []
+        for grid in stream:
+            solved = grid.copy()
+            start = time.perf_counter()
+            main.solve_sudoku(solved)
+            direct.append(time.perf_counter() - start)
+            through = grid.copy()
+            start = time.perf_counter()
+            cache(through)
+            cached.append(time.perf_counter() - start)
+            assert through == solved or main.count_solutions(grid) > 1
+        results[name] = {
+            'direct': summary(direct),
+            'cached': summary(cached),
+            **cache.stats(),
+        }
+        show(f'{name} direct', results[name]['direct'])
+        show(f'{name} cached', results[name]['cached'])
+        print(f'{"":<32} hit rate {cache.stats()["hit_rate"]:.2f}')
+    return results
+
+
+def bench_generators(seed: int, count: int) -> dict[str, Any]:
+    cases: dict[str, Callable[[], object]] = {
+        'fill_grid': lambda: main.fill_grid(FlatGrid()),
+        'generate_sudoku/41': functools.partial(main.generate_sudoku, 41),
+        'generate_sudoku/17': functools.partial(main.generate_sudoku, 17),
+    }
+    results: dict[str, Any] = {}
+    for name, make in cases.items():
+        random.seed(f'{seed}:{name}')
+        times = []
+        for _ in range(count):
+            start = time.perf_counter()
+            make()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        make()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = {**summary(times), 'peak_kib': peak / 1024}
+        show(name, results[name])
+    return results
+
+
+def bench_parser(repeat: int) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    print(f'{"attributes":>10} {"bytes":>7} {"legacy us":>10} {"htinter us":>10}')
+    for attributes in (2, 16, 128, 1024):
+        query = click_query(attributes)
+        legacy = legacy_query(query)
+        current = ht._extraire(query)
+        assert legacy == current, 'parsers disagree'
+        number = max(1, 2000 // attributes)
+        old = bench(functools.partial(legacy_query, query), repeat, number)
+        new = bench(functools.partial(ht._extraire, query), repeat, number)
+        print(f'{attributes:>10} {len(query):>7} {old * 1e6:>10.1f} {new * 1e6:>10.1f}')
+        results[f'extraire/{attributes}'] = {
+            'bytes': len(query),
+            'legacy_us': old * 1e6,
+            'htinter_us': new * 1e6,
+        }
+
+    request = b'GET /__cc__..cell?' + click_query(16) + b' HTTP/1.1\r\nHost: x\r\n'
+    request += b'Accept-Encoding: gzip\r\nConnection: keep-alive'
+    whole = bench(functools.partial(ht._analyser, request), repeat, 1000)
+    print(f'_analyser, 16-attribute click: {whole * 1e6:.1f} us')
+    results['analyser/16'] = {'us': whole * 1e6}
+    return results
+
+
+def serve(port: int, travailleurs: int, metrics: bool) -> None:
+    # Child process: the game as main.py serves it, without the pool.
+    ht.régler_métriques(metrics)
+    ht.def_état(main.Game)
+    ht.init_page(main.main)
+    ht.servir(port=port, travailleurs=travailleurs)
+
+
+EMPTY_CELL = re.compile(r'<td class="cell" y="(\d)" x="(\d)">')
+
+
+def player(port: int, moves: int, seed: int, samples: dict[str, list[float]]) -> None:
+    # One page: loads the game, then clicks empty cells and types digits,
+    # validating every tenth move, as fast as the server answers.
+    rnd = random.Random(seed)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def get(kind: str, url: str) -> bytes:
+        start = time.perf_counter()
+        conn.request('GET', url)
+        body = conn.getresponse().read()
+        samples.setdefault(kind, []).append(time.perf_counter() - start)
+        return body
+
+    actions = json.loads(get('init', '/__init?location_pathname=/'))
+    session = actions['session']
+    empty = EMPTY_CELL.findall(actions['contenu']['#grid'])
+    for move in range(moves):
+        y, x = rnd.choice(empty)
+        get(
+            'click',
+            f'/__cc__..cell?objet=.cell&class=cell&y={y}&x={x}&__session={session}',
+        )
+        get('key', f'/__ec.to__?touche={rnd.randint(1, 9)}&__session={session}')
+        if move % 10 == 9:
+            get('validate', f'/__ec.to__?touche=Enter&__session={session}')
+    conn.close()
+
+
+def bench_load(
+    clients: int, moves: int, travailleurs: int, seed: int, metrics: bool = False
+) -> dict[str, Any]:
+    # The server gets its own process; the clients are threads of this one,
+    # so with many clients the numbers include some client-side contention.
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = multiprocessing.Process(
+        target=serve, args=(port, travailleurs, metrics), daemon=True
+    )
+    server.start()
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+        samples = [dict[str, list[float]]() for _ in range(clients)]
+        threads = [
+            threading.Thread(target=player, args=(port, moves, seed + k, samples[k]))
+            for k in range(clients)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.join()
+
+    merged: dict[str, list[float]] = {}
+    for per_client in samples:
+        for kind, times in per_client.items():
+            merged.setdefault(kind, []).extend(times)
+    requests = sum(len(times) for times in merged.values())
+    results: dict[str, Any] = {
+        'clients': clients,
+        'travailleurs': travailleurs,
+        'metrics': metrics,
+        'requests': requests,
+        'seconds': elapsed,
+        'requests_per_s': requests / elapsed,
+        'latency': {kind: summary(times) for kind, times in merged.items()},
+        'all': summary([t for times in merged.values() for t in times]),
+    }
+    print(
+        f'load: {clients} clients, {requests} requests in {elapsed:.2f} s, '
+        f'{requests / elapsed:.0f} req/s'
+    )
+    for kind, result in results['latency'].items():
+        show(f'  {kind}', result)
+    return results
+
+
+SUITES = ('solvers', 'cache', 'generators', 'parser', 'load')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('suites', nargs='*', choices=SUITES, default=SUITES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--count', type=int, default=20)
+    parser.add_argument('--engines', nargs='+', default=list(main.SOLVERS))
+    parser.add_argument('--timeout', type=float, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--variants', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--moves', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument(
+        '--metrics', action='store_true', help='serve with ht.régler_métriques()'
+    )
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    report: dict[str, Any] = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': multiprocessing.cpu_count(),
+            'args': vars(args),
+        }
+    }
+    if 'solvers' in args.suites or 'cache' in args.suites:
+        sets = dataset(args.seed, args.count)
+    if 'solvers' in args.suites:
+        report['solvers'] = bench_solvers(sets, args.engines, args.timeout)
+    if 'cache' in args.suites:
+        report['cache'] = bench_cache(sets, args.seed, args.variants)
+    if 'generators' in args.suites:
+        report['generators'] = bench_generators(args.seed, args.count)
+    if 'parser' in args.suites:
+        report['parser'] = bench_parser(args.repeat)
+    if 'load' in args.suites:
+        report['load'] = bench_load(
+            args.clients, args.moves, args.workers, args.seed, args.metrics
+        )
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(report, out, indent=2)
@@ -0,0 +1,118 @@
+from grid import CELL_BOX, CELL_COL, CELL_ROW, UNITS, FlatGrid
+
+CELL_UNITS = [(CELL_ROW[i], 9 + CELL_COL[i], 18 + CELL_BOX[i]) for i in range(81)]
+
+
+class Board:
+    # Player-side state of a game, kept up to date move by move: how many
+    # cells are filled and correct, how often each digit occurs in each
+    # unit, which cells clash with a peer, and which cells changed since
+    # the last validation. Each move costs its three units, never the
+    # whole grid.
+    __slots__ = (
+        'cells',
+        'given',
+        'solution',
+        'filled',
+        'correct',
+        'counts',
+        'conflicts',
+        'dirty',
+        'marks',
+    )
+
+    def __init__(self, grid: FlatGrid, solution: FlatGrid) -> None:
+        # Shares grid's cells, so the grid always shows the player's moves.
+        self.cells = grid.cells
+        self.given = bytes(grid.cells)
+        self.solution = bytes(solution.cells)
+        self.filled = 0
+        self.correct = 0
+        # counts[unit * 10 + num]: cells of the unit holding num
+        self.counts = [0] * (len(UNITS) * 10)
+        self.conflicts: set[int] = set()
+        self.dirty: set[int] = set()
+        # cell -> whether its digit matched the solution when last validated
+        self.marks: dict[int, bool] = {}
+        for i, num in enumerate(self.cells):
+            if num:
+                self.cells[i] = 0
+                self.set(i, num)
+        self.dirty.clear()
+
+    @property
+    def complete(self) -> bool:
+        return self.filled == 81
+
+    @property
+    def solved(self) -> bool:
+        return self.correct == 81
+
+    def clashes(self, i: int) -> bool:
+        num = self.cells[i]
+        if not num:
+            return False
+        counts = self.counts
+        r, c, b = CELL_UNITS[i]
+        return (
+            counts[r * 10 + num] > 1
+            or counts[c * 10 + num] > 1
+            or counts[b * 10 + num] > 1
+        )
+
+    def _count(self, i: int, num: int, delta: int, touched: list[int]) -> None:
+        # Applies delta to num's count in each unit of i. When a unit
+        # crosses the 1 <-> 2 boundary, the holders of num there may have
+        # entered or left the conflict set, so they are added to touched.
+        cells = self.cells
+        counts = self.counts
+        crossing = 2 if delta > 0 else 1
+        for u in CELL_UNITS[i]:
+            k = u * 10 + num
+            counts[k] += delta
+            if counts[k] == crossing:
+                touched += [j for j in UNITS[u] if cells[j] == num]
+
+    def set(self, i: int, num: int) -> set[int]:
+        # Writes num (0 clears) into cell i and returns the cells that
+        # entered or left the conflict set.
+        old = self.cells[i]
+        if old == num:
+            return set()
+        self.dirty.add(i)
+        self.marks.pop(i, None)
+        touched = [i]
+        if old:
+            self.cells[i] = 0
+            self._count(i, old, -1, touched)
+            self.filled -= 1
+            self.correct -= old == self.solution[i]
+        if num:
+            self.cells[i] = num
+            self._count(i, num, 1, touched)
+            self.filled += 1
+            self.correct += num == self.solution[i]
+
+        conflicts = self.conflicts
+        flipped = set()
+        for j in touched:
+            if self.clashes(j) != (j in conflicts):
+                if j in conflicts:
+                    conflicts.remove(j)
+                else:
+                    conflicts.add(j)
+                flipped.add(j)
+        return flipped
+
+    def validate(self) -> list[int]:
+        # Marks the player's digits against the solution. Cells untouched
+        # since the last call keep their marks, so only the changed ones
+        # are compared and returned.
+        changed = []
+        for i in self.dirty:
+            num = self.cells[i]
+            if num and not self.given[i]:
+                self.marks[i] = num == self.solution[i]
+                changed.append(i)
+        self.dirty.clear()
+        return changed
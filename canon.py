@@ -0,0 +1,270 @@
+import collections
+import itertools
+import math
+import random
+import threading
+from typing import Any, Callable, NamedTuple, Optional
+
+from grid import FlatGrid
+
+# Past this many candidate arrangements (puzzles whose clue pattern is very
+# symmetric, like an empty grid), canonical() gives up rather than spend
+# longer than a solve would.
+MAX_ARRANGEMENTS = 2000
+
+# SeedSet.derive(clues=n) draws from every seed within this many clues
+# of the count nearest n, not just from that count.
+CLUE_TOLERANCE = 3
+
+TRANSPOSE = [c * 9 + r for r in range(9) for c in range(9)]
+
+
+class Transform(NamedTuple):
+    # Maps a puzzle onto its canonical form: optional transpose, then row
+    # rows[k] becomes row k and column cols[k] becomes column k, then digit
+    # d becomes labels[d].
+    transpose: bool
+    rows: tuple[int, ...]
+    cols: tuple[int, ...]
+    labels: bytes
+
+    def apply(self, cells: bytes) -> bytes:
+        if self.transpose:
+            cells = bytes(cells[i] for i in TRANSPOSE)
+        labels = self.labels
+        return bytes(labels[cells[r * 9 + c]] for r in self.rows for c in self.cols)
+
+    def undo(self, cells: bytes) -> bytes:
+        digits = bytearray(10)
+        for digit, label in enumerate(self.labels):
+            digits[label] = digit
+        out = bytearray(81)
+        k = 0
+        for r in self.rows:
+            for c in self.cols:
+                out[r * 9 + c] = digits[cells[k]]
+                k += 1
+        if self.transpose:
+            return bytes(out[i] for i in TRANSPOSE)
+        return bytes(out)
+
+
+def random_transform(rnd: Optional[random.Random] = None) -> Transform:
+    # Any mix of the symmetries maps a valid grid to a valid grid, and a
+    # puzzle with a unique solution to one with a unique solution.
+    sample = random.sample if rnd is None else rnd.sample
+    rows = [b * 3 + r for b in sample(range(3), 3) for r in sample(range(3), 3)]
+    cols = [s * 3 + c for s in sample(range(3), 3) for c in sample(range(3), 3)]
+    labels = bytes([0, *sample(range(1, 10), 9)])
+    transpose = (random.random() if rnd is None else rnd.random()) < 0.5
+    return Transform(transpose, tuple(rows), tuple(cols), labels)
+
+
+class _Lines(NamedTuple):
+    # How the rows (or columns) of a grid may be ordered: bands sorted by
+    # key, lines sorted by key within each band, equal keys left free.
+    signature: list[Any]
+    bands: list[list[int]]
+    lines: dict[int, list[list[int]]]
+    arrangements: int
+
+
+def _groups(items: list[int], keys: list[Any]) -> list[list[int]]:
+    # items sorted by key, split into runs of equal keys
+    items = sorted(items, key=keys.__getitem__)
+    return [list(run) for _, run in itertools.groupby(items, keys.__getitem__)]
+
+
+def _lines(cells: bytes, lines: list[list[int]]) -> _Lines:
+    # A line's key is its clue count, then the clue counts of the crossing
+    # lines it has clues in; a band's key is its sorted line keys. No
+    # Sudoku symmetry changes either.
+    counts = [sum(1 for i in line if cells[i]) for line in lines]
+    crossing = [sum(1 for j in range(9) if cells[lines[j][k]]) for k in range(9)]
+    keys: list[Any] = [
+        (counts[n], sorted(crossing[k] for k, i in enumerate(lines[n]) if cells[i]))
+        for n in range(9)
+    ]
+    band_keys = [sorted(keys[b * 3 + k] for k in range(3)) for b in range(3)]
+    bands = _groups([0, 1, 2], band_keys)
+    per_band = {b: _groups([b * 3 + k for k in range(3)], keys) for b in range(3)}
+    arrangements = 1
+    for group in bands + [g for groups in per_band.values() for g in groups]:
+        arrangements *= math.factorial(len(group))
+    return _Lines(sorted(band_keys), bands, per_band, arrangements)
+
+
+def _arrangements(lines: _Lines) -> list[tuple[int, ...]]:
+    res = []
+    for bands in itertools.product(*map(itertools.permutations, lines.bands)):
+        per_band = [
+            [
+                [n for group in groups for n in group]
+                for groups in itertools.product(
+                    *map(itertools.permutations, lines.lines[b])
+                )
+            ]
+            for group in bands
+            for b in group
+        ]
+        for first, second, third in itertools.product(*per_band):
+            res.append(tuple(first + second + third))
+    return res
+
+
+def canonical(grid: FlatGrid) -> Optional[tuple[bytes, Transform]]:
+    # The least relabelled grid over every arrangement that sorts rows,
+    # columns, bands and stacks by their invariant keys, in either
+    # orientation. That set of arrangements moves along with any symmetry
+    # applied to the puzzle, so equivalent puzzles share one canonical
+    # form. Returns None past MAX_ARRANGEMENTS.
+    original = bytes(grid.cells)
+    rows = [[r * 9 + c for c in range(9)] for r in range(9)]
+    cols = [[r * 9 + c for r in range(9)] for c in range(9)]
+
+    candidates = []
+    for transpose in (False, True):
+        cells = bytes(original[i] for i in TRANSPOSE) if transpose else original
+        row_lines, col_lines = _lines(cells, rows), _lines(cells, cols)
+        signature = [row_lines.signature, col_lines.signature]
+        candidates.append((signature, transpose, cells, row_lines, col_lines))
+    # only the orientations with the least invariant signature compete
+    best = min(c[0] for c in candidates)
+    candidates = [c for c in candidates if c[0] == best]
+    if (
+        sum(c[3].arrangements * c[4].arrangements for c in candidates)
+        > MAX_ARRANGEMENTS
+    ):
+        return None
+
+    result: Optional[tuple[bytes, Transform]] = None
+    for _, transpose, cells, row_lines, col_lines in candidates:
+        row_orders = _arrangements(row_lines)
+        col_orders = _arrangements(col_lines)
+        for row_order in row_orders:
+            for col_order in col_orders:
+                labels = bytearray(10)
+                out = bytearray(81)
+                free = 1
+                k = 0
+                for r in row_order:
+                    base = r * 9
+                    for c in col_order:
+                        num = cells[base + c]
+                        if num:
+                            if not labels[num]:
+                                labels[num] = free
+                                free += 1
+                            out[k] = labels[num]
+                        k += 1
+                if result is None or out < result[0]:
+                    # digits absent from the puzzle take the remaining labels
+                    for num in range(1, 10):
+                        if not labels[num]:
+                            labels[num] = free
+                            free += 1
+                    result = (
+                        bytes(out),
+                        Transform(transpose, row_order, col_order, bytes(labels)),
+                    )
+    return result
+
+
+class SolutionCache:
+    # Bounded LRU of solutions keyed by canonical form, so a puzzle and any
+    # relabelled, permuted or transposed copy of it are solved once. Stores
+    # the canonical puzzle's solution (None when it has none) and maps it
+    # back through the caller's transform.
+    __slots__ = ('solve', 'size', 'entries', 'hits', 'misses', 'skipped', 'lock')
+
+    def __init__(self, solve: Callable[[FlatGrid], bool], size: int = 4096) -> None:
+        self.solve = solve
+        self.size = size
+        self.entries: collections.OrderedDict[bytes, Optional[bytes]] = (
+            collections.OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, grid: FlatGrid) -> bool:
+        # Same contract as the solvers: fills grid in place, False if it
+        # has no solution.
+        found = canonical(grid)
+        if found is None:
+            with self.lock:
+                self.skipped += 1
+            return self.solve(grid)
+        key, transform = found
+        with self.lock:
+            hit = key in self.entries
+            if hit:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                solution = self.entries[key]
+            else:
+                self.misses += 1
+        if not hit:
+            puzzle = FlatGrid(key)
+            solution = bytes(puzzle.cells) if self.solve(puzzle) else None
+            with self.lock:
+                self.entries[key] = solution
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        if solution is None:
+            return False
+        grid.cells[:] = transform.undo(solution)
+        return True
+
+    def stats(self) -> dict[str, float]:
+        with self.lock:
+            looked_up = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'skipped': self.skipped,
+                'hit_rate': self.hits / looked_up if looked_up else 0.0,
+                'entries': len(self.entries),
+            }
+
+
+class SeedSet:
+    # Verified (puzzle, solution) pairs to derive new games from: a random
+    # symmetry applied to both keeps the solution valid and unique, so a
+    # derived puzzle needs neither fill_grid nor a solve. Its clue count
+    # and grade are those of its seed, so seeds are indexed by the level
+    # the caller graded them at (None: only drawn by clue count).
+    __slots__ = ('seeds', 'by_level')
+
+    def __init__(self, seeds: list[tuple[FlatGrid, FlatGrid, Optional[str]]]) -> None:
+        if not seeds:
+            raise ValueError('a seed set needs at least one seed')
+        self.seeds: list[tuple[bytes, bytes, int]] = []
+        self.by_level: dict[str, list[int]] = {}
+        for puzzle, solution, level in seeds:
+            if level is not None:
+                self.by_level.setdefault(level, []).append(len(self.seeds))
+            self.seeds.append(
+                (bytes(puzzle.cells), bytes(solution.cells), 81 - puzzle.cells.count(0))
+            )
+
+    def __len__(self) -> int:
+        return len(self.seeds)
+
+    def derive(
+        self,
+        level: Optional[str] = None,
+        clues: Optional[int] = None,
+        rnd: Optional[random.Random] = None,
+    ) -> tuple[FlatGrid, FlatGrid]:
+        # From any seed of the level (of any seed when None). With clues,
+        # only from those whose clue count is within CLUE_TOLERANCE of the
+        # nearest one to it.
+        pool = self.by_level[level] if level is not None else range(len(self.seeds))
+        if clues is not None:
+            gap = min(abs(self.seeds[k][2] - clues) for k in pool) + CLUE_TOLERANCE
+            pool = [k for k in pool if abs(self.seeds[k][2] - clues) <= gap]
+        puzzle, solution, _ = self.seeds[(random if rnd is None else rnd).choice(pool)]
+        transform = random_transform(rnd)
+        return FlatGrid(transform.apply(puzzle)), FlatGrid(transform.apply(solution))
@@ -0,0 +1,492 @@
+import argparse
+import contextlib
+import gzip
+import http.client
+import io
+import json
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+from typing import Callable, Optional
+
+import htinter as ht
+import main
+from board import Board
+from canon import canonical
+from grader import GUESS, LEVELS, grade
+from grid import PEERS, UNITS, FlatGrid
+
+# Consistency checks, each against a deliberately naive recomputation
+# that shares no code with what it checks:
+#   python check.py [checks...] [--seed N] [--count N]
+# Stops at the first disagreement with a non-zero exit status.
+
+
+def expect(ok: bool, what: str) -> None:
+    if not ok:
+        raise AssertionError(what)
+
+
+def consistent(cells: bytearray) -> bool:
+    return all(
+        not num or all(cells[p] != num for p in PEERS[i]) for i, num in enumerate(cells)
+    )
+
+
+def naive_count(cells: bytearray, limit: int = 2) -> int:
+    # Backtracking on the empty cell with the fewest candidates, found by
+    # rescanning the grid every time.
+    if not consistent(cells):
+        return 0
+    return _naive_count(cells, limit)
+
+
+def _naive_count(cells: bytearray, limit: int) -> int:
+    best = -1
+    options: list[int] = []
+    for i in range(81):
+        if not cells[i]:
+            used = {cells[p] for p in PEERS[i]}
+            candidates = [num for num in range(1, 10) if num not in used]
+            if best == -1 or len(candidates) < len(options):
+                best, options = i, candidates
+                if not candidates:
+                    return 0
+    if best == -1:
+        return 1
+    found = 0
+    for num in options:
+        cells[best] = num
+        found += _naive_count(cells, limit - found)
+        cells[best] = 0
+        if found >= limit:
+            break
+    return found
+
+
+def valid_solution(puzzle: FlatGrid, solution: FlatGrid) -> bool:
+    return all(
+        sorted(solution.cells[i] for i in unit) == main.DIGITS for unit in UNITS
+    ) and all(not p or p == s for p, s in zip(puzzle.cells, solution.cells))
+
+
+def check_engines(rnd: random.Random, count: int) -> int:
+    # Every engine solves every puzzle, to the same valid solution.
+    cases = 0
+    for clues in (41, 25):
+        for _ in range(count):
+            puzzle, _ = main.generate_sudoku(clues)
+            solutions = {}
+            for engine in main.SOLVERS:
+                grid = puzzle.copy()
+                expect(main.solve_sudoku(grid, engine), f'{engine} found no solution')
+                expect(valid_solution(puzzle, grid), f'{engine} solution is invalid')
+                solutions[engine] = bytes(grid.cells)
+            expect(len(set(solutions.values())) == 1, f'engines disagree: {puzzle}')
+            cases += 1
+    return cases
+
+
+def check_counts(rnd: random.Random, count: int) -> int:
+    # count_solutions and solution_status against naive_count on grids
+    # with random holes, some given a wrong but non-clashing clue; the
+    # fixed cases make sure 0, 1 and 2 all come up.
+    solution = FlatGrid()
+    main.fill_grid(solution)
+    clash = solution.copy()
+    clash.cells[1] = clash.cells[0]
+    grids = [FlatGrid(), solution.copy(), clash]
+    for _ in range(count * 3):
+        grid = solution.copy()
+        for i in rnd.sample(range(81), rnd.randint(20, 60)):
+            grid.cells[i] = 0
+        if rnd.random() < 0.5:
+            empty = [i for i in range(81) if not grid.cells[i]]
+            i = rnd.choice(empty)
+            wrong = [
+                num
+                for num in range(1, 10)
+                if num != solution.cells[i]
+                and all(grid.cells[p] != num for p in PEERS[i])
+            ]
+            if wrong:
+                grid.cells[i] = rnd.choice(wrong)
+        grids.append(grid)
+
+    seen = set()
+    for grid in grids:
+        expected = naive_count(grid.copy().cells)
+        found = main.count_solutions(grid)
+        expect(found == expected, f'count_solutions {found} != {expected}: {grid}')
+        status = main.solution_status(grid)
+        expect(status == ('none', 'unique', 'multiple')[expected], f'status {status}')
+        seen.add(found)
+    expect(seen == {0, 1, 2}, f'only counts {sorted(seen)} came up')
+    return len(grids)
+
+
+def check_dig_holes(rnd: random.Random, count: int) -> int:
+    # Dug puzzles keep exactly one solution, the grid they were dug from.
+    cases = 0
+    for clues in (41, 25, 17):
+        for _ in range(count):
+            puzzle, solution = main.generate_sudoku(clues)
+            expect(
+                valid_solution(puzzle, solution), f'not dug from a solution: {puzzle}'
+            )
+            expect(naive_count(puzzle.copy().cells) == 1, f'not unique: {puzzle}')
+            if clues == 41:
+                expect(puzzle.cells.count(0) == 81 - clues, f'not 41 clues: {puzzle}')
+            cases += 1
+    return cases
+
+
+def check_board(rnd: random.Random, count: int) -> int:
+    # Random moves, with filled, correct, the unit digit counts and the
+    # conflict set recomputed from scratch after each.
+    moves = 0
+    for _ in range(count):
+        puzzle, solution = main.new_game('beginner')
+        board = Board(puzzle, solution)
+        cells = puzzle.cells
+        for _ in range(500):
+            i = rnd.randrange(81)
+            if board.given[i]:
+                continue
+            before = set(board.conflicts)
+            flipped = board.set(i, rnd.randrange(10))
+            conflicts = {
+                j
+                for j in range(81)
+                if cells[j] and any(cells[p] == cells[j] for p in PEERS[j])
+            }
+            expect(board.conflicts == conflicts, f'conflicts after move {moves}')
+            expect(flipped == before ^ conflicts, f'flipped cells after move {moves}')
+            expect(board.filled == 81 - cells.count(0), f'filled after move {moves}')
+            expect(
+                board.correct == sum(a == b for a, b in zip(cells, solution.cells)),
+                f'correct after move {moves}',
+            )
+            for u, unit in enumerate(UNITS):
+                for num in range(1, 10):
+                    held = sum(cells[j] == num for j in unit)
+                    expect(
+                        board.counts[u * 10 + num] == held, f'counts after move {moves}'
+                    )
+            moves += 1
+    return moves
+
+
+def shuffled(cells: bytes, rnd: random.Random) -> bytes:
+    # A random symmetry of the grid, spelled out: bands, rows within a
+    # band, stacks, columns within a stack, digits, and maybe a transpose.
+    rows = [b * 3 + r for b in rnd.sample(range(3), 3) for r in rnd.sample(range(3), 3)]
+    cols = [s * 3 + c for s in rnd.sample(range(3), 3) for c in rnd.sample(range(3), 3)]
+    digits = [0, *rnd.sample(range(1, 10), 9)]
+    out = [digits[cells[r * 9 + c]] for r in rows for c in cols]
+    if rnd.random() < 0.5:
+        out = [out[c * 9 + r] for r in range(9) for c in range(9)]
+    return bytes(out)
+
+
+def check_canon(rnd: random.Random, count: int) -> int:
+    # Every symmetric copy of a puzzle has the same canonical form, and
+    # the transforms returned map each copy onto it and back.
+    cases = 0
+    for clues in (41, 25):
+        for _ in range(count):
+            puzzle, _ = main.generate_sudoku(clues)
+            found = canonical(puzzle)
+            if found is None:
+                continue
+            key, _ = found
+            for _ in range(3):
+                copy = shuffled(bytes(puzzle.cells), rnd)
+                found = canonical(FlatGrid(copy))
+                expect(found is not None, f'no canonical form for a copy: {puzzle}')
+                assert found is not None
+                expect(found[0] == key, f'copies canonicalize apart: {puzzle}')
+                expect(
+                    found[1].apply(copy) == key, f'transform misses the key: {puzzle}'
+                )
+                expect(found[1].undo(key) == copy, f'transform does not undo: {puzzle}')
+                cases += 1
+    return cases
+
+
+def singles_solve(cells: bytearray) -> bool:
+    # Places naked and hidden singles, one at a time with every candidate
+    # recomputed from scratch, until stuck; True if that fills the grid.
+    while 0 in cells:
+        candidates = {
+            i: set(main.DIGITS) - {cells[p] for p in PEERS[i]}
+            for i in range(81)
+            if not cells[i]
+        }
+        placed = [(i, min(c)) for i, c in candidates.items() if len(c) == 1]
+        for unit in UNITS:
+            for num in main.DIGITS:
+                where = [i for i in unit if num in candidates.get(i, ())]
+                if len(where) == 1:
+                    placed.append((where[0], num))
+        if not placed:
+            return False
+        i, num = placed[0]
+        cells[i] = num
+    return True
+
+
+def check_grader(rnd: random.Random, count: int) -> int:
+    # A unique puzzle grades at singles level (beginner) exactly when
+    # singles alone solve it, and every rank maps to its level.
+    seen = set()
+    cases = 0
+    for clues in (41, 30, 25):
+        for _ in range(count):
+            puzzle, _ = main.generate_sudoku(clues)
+            result = grade(puzzle)
+            easy = singles_solve(puzzle.copy().cells)
+            expect(
+                (result.rank <= LEVELS['beginner']) == easy,
+                f'rank {result.rank}: {puzzle}',
+            )
+            level = next((n for n, top in LEVELS.items() if result.rank <= top), None)
+            expect(
+                result.level == level, f'level {result.level} for rank {result.rank}'
+            )
+            expect(
+                (result.level is None) == (result.rank == GUESS),
+                f'level {result.level}',
+            )
+            seen.add(easy)
+            cases += 1
+    expect(
+        seen == {True, False},
+        f'only {"easy" if True in seen else "hard"} puzzles came up',
+    )
+    return cases
+
+
+def naive_unquote(text: str, keep: str = '') -> Optional[str]:
+    # urllib's %-decoding, the escapes of the characters in keep left as
+    # they are; None for a stray % or bytes that are not UTF-8.
+    if re.search('%(?![0-9A-Fa-f]{2})', text):
+        return None
+    kept = '|'.join(f'%{ord(c):02x}' for c in keep) or '(?!)'
+    pieces = re.split(f'((?i:{kept}))', text)
+    raw = b''.join(
+        p.encode() if k % 2 else urllib.parse.unquote_to_bytes(p)
+        for k, p in enumerate(pieces)
+    )
+    try:
+        return raw.decode()
+    except UnicodeDecodeError:
+        return None
+
+
+def random_escaped(rnd: random.Random) -> str:
+    # A short %-encoded string, some escapes in lower case, now and then
+    # broken or not UTF-8.
+    text = ''.join(rnd.choice('aZ9é +=&%/?-') for _ in range(rnd.randint(0, 6)))
+    escaped = urllib.parse.quote(text, safe='+')
+    escaped = re.sub(
+        '%[0-9A-F]{2}', lambda m: rnd.choice((m[0], m[0].lower())), escaped
+    )
+    if rnd.random() < 0.05:
+        escaped += rnd.choice(('%', '%4', '%g1', '%FF', '%C3'))
+    return escaped
+
+
+def check_parser(rnd: random.Random, count: int) -> int:
+    # ht._analyser against urllib.parse on random GET requests: the path
+    # keeps =, & and % escaped, the query is split before being decoded,
+    # header names are lower-cased and values stripped.
+    for _ in range(count * 50):
+        path = '/' + '/'.join(random_escaped(rnd) for _ in range(rnd.randint(1, 3)))
+        query = '&'.join(
+            random_escaped(rnd) + rnd.choice(('=', '')) + random_escaped(rnd)
+            for _ in range(rnd.randint(0, 3))
+        )
+        target = path + ('?' + query if query or rnd.random() < 0.5 else '')
+        names = rnd.sample(
+            ['Host', 'Range', 'Accept-Encoding', 'X-Test', 'Connection'], 3
+        )
+        headers = {n: ''.join(rnd.choice('ab ;=,') for _ in range(5)) for n in names}
+        req = (
+            f'GET {target} HTTP/1.1\r\n'
+            + ''.join(
+                f'{rnd.choice((n, n.upper()))}:{v} \r\n' for n, v in headers.items()
+            )
+        ).encode()
+        parsed = ht._analyser(req)
+
+        chemin = naive_unquote(path, keep='=&%')
+        pairs = [pair.partition('=') for pair in query.split('&')]
+        params = {naive_unquote(k): naive_unquote(v) for k, _, v in pairs}
+        if chemin is None or None in params or None in params.values():
+            expect(parsed is None, f'accepted {target!r}')
+            continue
+        expect(parsed is not None, f'rejected {target!r}')
+        assert parsed is not None
+        expect(parsed.chemin == chemin, f'path {parsed.chemin!r} != {chemin!r}')
+        expect(parsed.params == params, f'params {parsed.params!r} != {params!r}')
+        expect(
+            parsed.entêtes == {n.lower(): v.strip() for n, v in headers.items()},
+            f'headers {parsed.entêtes!r}',
+        )
+    expect(ht._analyser(b'POST / HTTP/1.1') is None, 'accepted a POST')
+    return count * 50 + 1
+
+
+def fetch(
+    port: int, path: str, headers: Optional[dict[str, str]] = None
+) -> tuple[int, dict[str, str], bytes]:
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        conn.request('GET', path, headers=headers or {})
+        response = conn.getresponse()
+        return (
+            response.status,
+            {k.lower(): v for k, v in response.getheaders()},
+            response.read(),
+        )
+    finally:
+        conn.close()
+
+
+def check_htinter(rnd: random.Random, count: int) -> int:
+    # A threaded server on a free port: session eviction and expiry,
+    # Range against slicing, 304 on both ETags, gzip against the file,
+    # and the 431 limit; then the request parser.
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    ht.api('/check', lambda c, p: None)
+    server = threading.Thread(target=ht.servir, kwargs={'port': port}, daemon=True)
+    with contextlib.redirect_stdout(io.StringIO()):  # start-up banner
+        server.start()
+        for _ in range(50):
+            try:
+                fetch(port, '/reset.css')
+                break
+            except OSError:
+                time.sleep(0.1)
+    cases = 0
+    try:
+
+        def init() -> str:
+            session = json.loads(fetch(port, '/__init?location_pathname=/')[2])
+            return str(session['session'])
+
+        def known(ident: str) -> bool:
+            actions: dict[str, object] = json.loads(
+                fetch(port, f'/check?__session={ident}')[2]
+            )
+            return not actions  # an unknown session is told to reload
+
+        # least recently served first out, past the maximum
+        ht.régler_sessions(maximum=3)
+        idents = [init() for _ in range(4)]
+        expect(not known(idents[0]), 'oldest session kept past the maximum')
+        expect(all(known(i) for i in idents[1:]), 'recent session dropped')
+        known(idents[1])
+        idents.append(init())
+        expect(not known(idents[2]), 'least recently served session kept')
+        expect(known(idents[1]), 'recently served session dropped')
+        ht.régler_sessions(maximum=3, durée=0.2)
+        time.sleep(0.3)
+        expect(not known(idents[1]), 'idle session kept past its duration')
+        expect(json.loads(fetch(port, '/check')[2]) == {}, 'session-less call')
+        cases += 7
+
+        with open('reset.css', 'rb') as f:
+            data = f.read()
+        size = len(data)
+        for _ in range(count * 5):
+            a, b = sorted(rnd.randrange(size + 20) for _ in range(2))
+            spec, expected = rnd.choice(
+                (
+                    (f'{a}-{b}', data[a : b + 1]),
+                    (f'{a}-', data[a:]),
+                    (f'-{b}', data[max(size - b, 0) :] if b else b''),
+                )
+            )
+            status, headers, body = fetch(
+                port, '/reset.css', {'Range': f'bytes={spec}'}
+            )
+            if expected:
+                expect(status == 206 and body == expected, f'bytes={spec}: {status}')
+                start = size - len(expected) if spec[0] == '-' else a
+                expect(
+                    headers['content-range']
+                    == f'bytes {start}-{start + len(expected) - 1}/{size}',
+                    f'bytes={spec}: {headers["content-range"]}',
+                )
+            else:
+                expect(status == 416, f'bytes={spec}: {status}, not 416')
+            cases += 1
+
+        status, plain, body = fetch(port, '/reset.css')
+        expect(status == 200 and body == data, 'plain file')
+        status, zipped, body = fetch(port, '/reset.css', {'Accept-Encoding': 'gzip'})
+        expect(
+            zipped.get('content-encoding') == 'gzip' and gzip.decompress(body) == data,
+            'gzip body',
+        )
+        expect(plain['etag'] != zipped['etag'], 'gzip variant shares the plain ETag')
+        for etag in (plain['etag'], zipped['etag']):
+            for encoding in ('gzip', 'identity'):
+                status, _, _ = fetch(
+                    port,
+                    '/reset.css',
+                    {'If-None-Match': etag, 'Accept-Encoding': encoding},
+                )
+                expect(status == 304, f'{etag} with {encoding}: {status}, not 304')
+        status, _, _ = fetch(port, '/reset.css', {'If-None-Match': '"stale"'})
+        expect(status == 200, f'stale ETag: {status}')
+        cases += 8
+
+        with socket.create_connection(('127.0.0.1', port), timeout=5) as c:
+            c.sendall(b'GET / HTTP/1.1\r\nX-Big: ' + b'a' * 70000 + b'\r\n\r\n')
+            reply = c.recv(64)
+        expect(reply.startswith(b'HTTP/1.1 431 '), f'oversized request: {reply!r}')
+        cases += 1
+    finally:
+        ht.régler_sessions()
+        ht.stop()
+        server.join(5)
+    return cases + check_parser(rnd, count)
+
+
+CHECKS: dict[str, Callable[[random.Random, int], int]] = {
+    'engines': check_engines,
+    'counts': check_counts,
+    'dig_holes': check_dig_holes,
+    'board': check_board,
+    'canon': check_canon,
+    'grader': check_grader,
+    'htinter': check_htinter,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('checks', nargs='*', choices=CHECKS, help='default: all')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--count', type=int, default=10)
+    args = parser.parse_args()
+
+    # the generator draws from the module-level random
+    random.seed(args.seed)
+    for name in args.checks or CHECKS:
+        start = time.perf_counter()
+        try:
+            cases = CHECKS[name](random.Random(args.seed), args.count)
+        except AssertionError as e:
+            print(f'{name}: FAILED: {e}')
+            sys.exit(1)
+        print(f'{name}: ok, {cases} cases in {time.perf_counter() - start:.1f} s')
@@ -0,0 +1,80 @@
+import mmap
+import os
+
+from grid import FlatGrid
+
+# Fixed-width records, so the n-th puzzle of a file lives at n * RECORD_SIZE.
+#   digits: the 81 puzzle digits (0 for blanks) followed by a newline
+#   packed: one byte per cell, puzzle digit in the high nibble and solution
+#           digit in the low nibble
+RECORD_SIZE = {'digits': 82, 'packed': 81}
+
+TO_DIGITS = bytes.maketrans(bytes(range(10)), b'0123456789')
+FROM_DIGITS = bytes.maketrans(b'0123456789', bytes(range(10)))
+HIGH_NIBBLE = bytes(b >> 4 for b in range(256))
+LOW_NIBBLE = bytes(b & 0xF for b in range(256))
+
+
+def encode(puzzle: FlatGrid, solution: FlatGrid, fmt: str) -> bytes:
+    if fmt == 'digits':
+        return bytes(puzzle.cells).translate(TO_DIGITS) + b'\n'
+    if fmt == 'packed':
+        return bytes(p << 4 | s for p, s in zip(puzzle.cells, solution.cells))
+    raise ValueError(f'unknown corpus format {fmt!r}')
+
+
+def record_count(path: str, fmt: str) -> int:
+    try:
+        return os.path.getsize(path) // RECORD_SIZE[fmt]
+    except FileNotFoundError:
+        return 0
+
+
+class Corpus:
+    # Read-only view of a corpus file through mmap: records are sliced out
+    # on demand, so opening a file of millions of puzzles costs no memory.
+    __slots__ = ('fmt', 'record_size', 'file', 'data')
+
+    def __init__(self, path: str, fmt: str = 'packed') -> None:
+        self.fmt = fmt
+        self.record_size = RECORD_SIZE[fmt]
+        self.file = open(path, 'rb')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.data = memoryview(b'')
+        else:
+            self.data = memoryview(
+                mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            )
+
+    def __len__(self) -> int:
+        return len(self.data) // self.record_size
+
+    def record(self, index: int) -> memoryview:
+        if not -len(self) <= index < len(self):
+            raise IndexError('corpus index out of range')
+        start = (index % len(self)) * self.record_size
+        return self.data[start : start + 81]
+
+    # The translations run in C from the mapped record straight into the
+    # grid's bytearray, without building any per-cell Python objects.
+    def puzzle(self, index: int) -> FlatGrid:
+        table = FROM_DIGITS if self.fmt == 'digits' else HIGH_NIBBLE
+        return FlatGrid(self.record(index).tobytes().translate(table))
+
+    def solution(self, index: int) -> FlatGrid | None:
+        if self.fmt == 'digits':
+            return None
+        return FlatGrid(self.record(index).tobytes().translate(LOW_NIBBLE))
+
+    def __getitem__(self, index: int) -> tuple[FlatGrid, FlatGrid | None]:
+        return self.puzzle(index), self.solution(index)
+
+    def close(self) -> None:
+        self.data.release()
+        self.file.close()
+
+    def __enter__(self) -> 'Corpus':
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
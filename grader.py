@@ -0,0 +1,199 @@
+import itertools
+from typing import NamedTuple, Sequence
+
+from grid import ALL_DIGITS, CELL_BOX, CELL_COL, CELL_ROW, PEERS, UNITS, FlatGrid
+
+# (name, points per use), from easiest to hardest. A puzzle's rank is the
+# index of the hardest technique it needed.
+TECHNIQUES = (
+    ('naked single', 1),
+    ('hidden single', 2),
+    ('locked candidates', 5),
+    ('naked pair', 8),
+    ('hidden pair', 10),
+    ('naked triple', 12),
+    ('x-wing', 20),
+    ('guess', 100),
+)
+GUESS = len(TECHNIQUES) - 1
+
+# Hardest technique rank allowed at each difficulty, easiest level first.
+LEVELS = {'beginner': 1, 'advanced': GUESS - 1}
+
+
+class Grade(NamedTuple):
+    score: int
+    rank: int
+    level: str | None
+
+    @property
+    def hardest(self) -> str:
+        return TECHNIQUES[self.rank][0]
+
+
+DIGIT_BITS = [1 << d for d in range(9)]
+
+
+class HumanSolver:
+    # Solves with candidate eliminations only, always reaching for the
+    # easiest technique that still makes progress, like a person would.
+    __slots__ = ('cand', 'left', 'uses')
+
+    def __init__(self, grid: FlatGrid) -> None:
+        self.cand = [0 if num else ALL_DIGITS for num in grid.cells]
+        self.left = self.cand.count(ALL_DIGITS)
+        self.uses = [0] * len(TECHNIQUES)
+        for i, num in enumerate(grid.cells):
+            if num:
+                self.eliminate_peers(i, 1 << (num - 1))
+
+    def eliminate_peers(self, i: int, bit: int) -> None:
+        cand = self.cand
+        for p in PEERS[i]:
+            cand[p] &= ~bit
+
+    def place(self, i: int, bit: int) -> None:
+        self.cand[i] = 0
+        self.left -= 1
+        self.eliminate_peers(i, bit)
+
+    def eliminate(self, cells: list[int], mask: int, keep: Sequence[int]) -> bool:
+        changed = False
+        for i in cells:
+            if i not in keep and self.cand[i] & mask:
+                self.cand[i] &= ~mask
+                changed = True
+        return changed
+
+    def naked_single(self) -> bool:
+        for i, mask in enumerate(self.cand):
+            if mask and mask & (mask - 1) == 0:
+                self.place(i, mask)
+                return True
+        return False
+
+    def hidden_single(self) -> bool:
+        cand = self.cand
+        for unit in UNITS:
+            once = twice = 0
+            for i in unit:
+                twice |= once & cand[i]
+                once |= cand[i]
+            singles = once & ~twice
+            if singles:
+                bit = singles & -singles
+                for i in unit:
+                    if cand[i] & bit:
+                        self.place(i, bit)
+                        return True
+        return False
+
+    def locked_candidates(self) -> bool:
+        cand = self.cand
+        for u, unit in enumerate(UNITS):
+            for bit in DIGIT_BITS:
+                cells = [i for i in unit if cand[i] & bit]
+                if len(cells) < 2:
+                    continue
+                if u >= 18:
+                    # pointing: a box digit confined to one row or column
+                    lines = [UNITS[CELL_ROW[cells[0]]], UNITS[9 + CELL_COL[cells[0]]]]
+                    same = [
+                        all(CELL_ROW[i] == CELL_ROW[cells[0]] for i in cells),
+                        all(CELL_COL[i] == CELL_COL[cells[0]] for i in cells),
+                    ]
+                    for line, ok in zip(lines, same):
+                        if ok and self.eliminate(line, bit, cells):
+                            return True
+                elif all(CELL_BOX[i] == CELL_BOX[cells[0]] for i in cells):
+                    # claiming: a line digit confined to one box
+                    if self.eliminate(UNITS[18 + CELL_BOX[cells[0]]], bit, cells):
+                        return True
+        return False
+
+    def naked_subset(self, size: int) -> bool:
+        cand = self.cand
+        for unit in UNITS:
+            cells = [i for i in unit if 1 < cand[i].bit_count() <= size]
+            for group in itertools.combinations(cells, size):
+                mask = 0
+                for i in group:
+                    mask |= cand[i]
+                if mask.bit_count() == size and self.eliminate(unit, mask, group):
+                    return True
+        return False
+
+    def hidden_pair(self) -> bool:
+        cand = self.cand
+        for unit in UNITS:
+            where: dict[int, list[int]] = {}
+            for bit in DIGIT_BITS:
+                cells = [i for i in unit if cand[i] & bit]
+                if len(cells) == 2:
+                    where[bit] = cells
+            bits = list(where)
+            for a, b in itertools.combinations(bits, 2):
+                if where[a] == where[b]:
+                    pair = a | b
+                    changed = False
+                    for i in where[a]:
+                        if cand[i] & ~pair:
+                            cand[i] &= pair
+                            changed = True
+                    if changed:
+                        return True
+        return False
+
+    def x_wing(self) -> bool:
+        cand = self.cand
+        for base, cover in ((0, 9), (9, 0)):
+            for bit in DIGIT_BITS:
+                spots: dict[tuple[int, ...], list[int]] = {}
+                for k in range(9):
+                    cells = [i for i in UNITS[base + k] if cand[i] & bit]
+                    if len(cells) == 2:
+                        key = tuple(
+                            CELL_COL[i] if base == 0 else CELL_ROW[i] for i in cells
+                        )
+                        spots.setdefault(key, []).extend(cells)
+                for key, cells in spots.items():
+                    if len(cells) == 4:
+                        for k in key:
+                            if self.eliminate(UNITS[cover + k], bit, cells):
+                                return True
+        return False
+
+    def step(self) -> int:
+        # Applies one technique and returns its rank, or GUESS when none of
+        # them makes progress.
+        steps = (
+            self.naked_single,
+            self.hidden_single,
+            self.locked_candidates,
+            lambda: self.naked_subset(2),
+            self.hidden_pair,
+            lambda: self.naked_subset(3),
+            self.x_wing,
+        )
+        for rank, technique in enumerate(steps):
+            if technique():
+                return rank
+        return GUESS
+
+    def run(self) -> int:
+        rank = 0
+        while self.left:
+            used = self.step()
+            self.uses[used] += 1
+            rank = max(rank, used)
+            if used == GUESS:
+                break
+        return rank
+
+
+def grade(grid: FlatGrid) -> Grade:
+    solver = HumanSolver(grid)
+    rank = solver.run()
+    score = sum(uses * points for uses, (_, points) in zip(solver.uses, TECHNIQUES))
+    level = next((name for name, top in LEVELS.items() if rank <= top), None)
+    return Grade(score, rank, level)
@@ -0,0 +1,74 @@
+from typing import Iterable, Iterator
+
+ALL_DIGITS = 0x1FF
+
+CELL_ROW = [i // 9 for i in range(81)]
+CELL_COL = [i % 9 for i in range(81)]
+CELL_BOX = [(i // 27) * 3 + (i % 9) // 3 for i in range(81)]
+UNITS = (
+    [[r * 9 + c for c in range(9)] for r in range(9)]
+    + [[r * 9 + c for r in range(9)] for c in range(9)]
+    + [
+        [(b // 3 * 3 + r) * 9 + b % 3 * 3 + c for r in range(3) for c in range(3)]
+        for b in range(9)
+    ]
+)
+PEERS = [
+    sorted(
+        set(UNITS[CELL_ROW[i]] + UNITS[9 + CELL_COL[i]] + UNITS[18 + CELL_BOX[i]]) - {i}
+    )
+    for i in range(81)
+]
+
+
+class FlatGrid:
+    # 81 cells in one bytearray, row-major. grid[row] is a writable
+    # memoryview of the row, so grid[row][col] reads and writes like the
+    # list of lists it replaces; hot paths index grid.cells directly.
+    __slots__ = ('cells', 'view')
+
+    def __init__(self, cells: Iterable[int] = bytes(81)) -> None:
+        self.cells = bytearray(cells)
+        if len(self.cells) != 81:
+            raise ValueError('a grid has exactly 81 cells')
+        self.view = memoryview(self.cells)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Iterable[int]]) -> 'FlatGrid':
+        return cls(num for row in rows for num in row)
+
+    def copy(self) -> 'FlatGrid':
+        return FlatGrid(self.cells)
+
+    def to_rows(self) -> list[list[int]]:
+        return [list(self.cells[r : r + 9]) for r in range(0, 81, 9)]
+
+    def row(self, row: int) -> memoryview:
+        return self.view[row * 9 : row * 9 + 9]
+
+    def col(self, col: int) -> memoryview:
+        return self.view[col::9]
+
+    def box(self, box: int) -> bytes:
+        return bytes(self.cells[i] for i in UNITS[18 + box])
+
+    def __getitem__(self, row: int) -> memoryview:
+        return self.view[row * 9 : row * 9 + 9]
+
+    def __iter__(self) -> Iterator[memoryview]:
+        for r in range(0, 81, 9):
+            yield self.view[r : r + 9]
+
+    def __len__(self) -> int:
+        return 9
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, FlatGrid):
+            return NotImplemented
+        return self.cells == other.cells
+
+    def __reduce__(self) -> tuple[type['FlatGrid'], tuple[bytes]]:
+        return FlatGrid, (bytes(self.cells),)
+
+    def __repr__(self) -> str:
+        return f'FlatGrid({bytes(self.cells)!r})'
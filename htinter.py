@@ -5,10 +5,24 @@ Le serveur fonctionne comme un serveur web pour tous les fichiers de l'arboresce
 
 Fonctions proposées.
   servir          : démarrer le serveur
+  servir_async    : démarrer le serveur dans une boucle asyncio (fonctions des api éventuellement asynchrones)
   stop            : arrêter le serveur
   api             : associer un chemin d'accès à une fonction affectuant des actions.
+  régler_cache    : fixer la mémoire réservée au cache des fichiers servis
+  régler_métriques: (dés)activer la mesure des requêtes, publiée au format Prometheus sur le chemin /__metriques
+  métriques       : obtenir le texte des mesures publiées sur /__metriques
+  régler_profilage: profiler (par échantillonnage) les appels d'api lents et en garder les relevés dans un dossier
   lier_param      : passer l'attribut value d'un objet en paramètre de toutes les actions déclenchées par la page html
 
+Sessions : chaque onglet reçoit son identifiant de session, gardé d'un rechargement à l'autre et renvoyé par le javascript à chaque appel.
+  def_état        : définir la fonction qui crée l'état propre à chaque session
+  état            : obtenir l'état de la session de la requête en cours
+  session         : obtenir la session de la requête en cours (état et tampon d'actions)
+  dans_session    : engager des actions hors requête pour une session donnée
+  régler_sessions : fixer le nombre maximal de sessions gardées en mémoire et leur durée de vie sans activité
+  régler_flux     : passer en mode flux : les battements sont exécutés par le serveur, qui pousse leurs actions
+                    (et celles engagées par dans_session) à la page par un flux Server-Sent Events
+
 Actions définissant un appel à une api.
   init_page       : définir une fonction à appeler à l'affichage de chaque page html
   capture_clic    : associer un événement au clic sur un objet
@@ -19,6 +33,12 @@ Actions sans lien explicite avec une api.
   contenu         : changer l'attribut innerHtml d'un objet de la page
   valeur          : changer l'attrbut value d'un objet de la page
   classes         : changer l'attribut class d'un objet de la page
+  indexer         : nommer la liste des objets désignés par un sélecteur, pour les désigner ensuite par leur rang
+  cellule         : changer le contenu et/ou la classe d'un objet d'une liste nommée par indexer, désigné par son rang
+
+Les actions d'une réponse sont appliquées à la page en un seul rafraîchissement (requestAnimationFrame).
+  régler_actions  : (dés)activer le regroupement des sélecteurs et la mesure de la taille des réponses
+  mesures_actions : obtenir les octets d'actions envoyés, avant et après regroupement
 
 Actions sans lien explicite avec la page html.
   def_battement   : définir un appel cyclique à une fonction python qui agit sur la page html
@@ -29,32 +49,424 @@ Auteur : M. Bordonaro
 
 import socket
 import json
+import queue
+import selectors
+import threading
+import time
+import asyncio
+import concurrent.futures
+import collections
+import contextlib
+import contextvars
+import inspect
+import secrets
+import heapq
+import bisect
+import itertools
+import traceback
+import os
+import gzip
+import cProfile
+import re
+import email.utils
 
 _catalogue = {}  # associations chemins-callbacks
 
-_battements = []  # liste des battements
+_battements = {}  # battements définis hors session : ref -> [commande, tempo, actif]
+
+_refs = (
+    itertools.count()
+)  # identifiants des battements, uniques pour toutes les sessions
 
 _continuer = True  # passe à False pour quitter le serveur une fois que toutes les donnés du socket ont été purgées
 
-_actions = {}  # l'objet à trasmettre en json en réponse à une requête
+_actions = {}  # actions engagées hors du traitement d'une requête, transmises avec la réponse suivante
+
+# l'objet à trasmettre en json en réponse à la requête en cours, propre à chaque fil d'exécution ou tâche asyncio
+_en_cours = contextvars.ContextVar('_en_cours', default=None)
+
+# session de la requête en cours, ou choisie par dans_session hors requête
+_session = contextvars.ContextVar('_session', default=None)
+
+_sessions = (
+    collections.OrderedDict()
+)  # identifiant -> Session, de la moins récemment servie à la plus récente
+
+_max_sessions = 1000  # au-delà, les sessions les moins récemment servies sont oubliées
+
+_durée_session = 1800  # secondes sans activité après lesquelles une session est oubliée
+
+_fabrique_état = lambda: None  # crée l'état d'une nouvelle session
+
+# protège _actions et _sessions quand les requêtes sont traitées en parallèle
+_verrou = threading.Lock()
+
+_cache = (
+    collections.OrderedDict()
+)  # chemin -> _Fichier, du moins récemment servi au plus récent
+
+_budget_cache = (
+    8 * 1024 * 1024
+)  # octets au plus occupés par les contenus du cache (0 : pas de cache)
+
+_taille_cache = 0  # octets occupés par les contenus du cache
+
+_verrou_cache = threading.Lock()
+
+_flux = False  # mode flux : battements exécutés par le serveur, actions poussées à la page (régler_flux)
+
+_CHEMIN_FLUX = '/__flux'  # flux Server-Sent Events ouvert par la page en mode flux
+
+_ATTENTE_FLUX = (
+    30  # secondes pendant lesquelles une session sans flux ouvert garde ses battements
+)
+
+_échéances = []  # tas des battements exécutés par le serveur : (échéance, numéro, session, ref)
+
+_numéros = itertools.count()  # départage les échéances égales
+
+_horloge = (
+    threading.Condition()
+)  # protège _échéances et réveille le fil d'exécution des battements
+
+_battant = (
+    None  # fil d'exécution des battements, lancé au premier battement en mode flux
+)
+
+_coalescer = (
+    True  # regrouper les sélecteurs consécutifs de même valeur (régler_actions)
+)
+
+_mesurer = False  # compter les octets d'actions envoyés, avant et après regroupement (régler_actions)
+
+_mesures = {'envois': 0, 'avant': 0, 'après': 0}  # voir mesures_actions
 
+_CHEMIN_JS = '/js'  # version future : pour personnaliser le javascript inséré
 
-def servir(ip: str = '127.0.0.1', port: int = 5080, max_conn: int = -1) -> None:
+_CHEMIN_MÉTRIQUES = '/__metriques'  # mesures des requêtes au format texte de Prometheus, si elles sont actives
+
+_métriques = (
+    None  # _Métriques tant que la mesure des requêtes est active (régler_métriques)
+)
+
+_profilage = None  # _Profilage tant que le profilage des appels lents est actif (régler_profilage)
+
+_chrono = contextvars.ContextVar(
+    '_chrono', default=None
+)  # _Chrono de la requête en cours si les métriques sont actives
+
+_TAILLE_MAX_REQUÊTE = (
+    64 * 1024
+)  # octets au plus pour la ligne de requête et les en-têtes
+
+_SEUIL_ENVOI = (
+    64 * 1024
+)  # octets au-delà desquels un fichier binaire est transmis par sendfile, sans être lu
+
+_SEUIL_ENVOI_TEXTE = (
+    8 * 1024 * 1024
+)  # de même pour un fichier textuel (hors .html), qui sinon profite du cache et de sa version gzip
+
+
+class Session:
     """
-    appel bloquant démarrant un serveur sur le port 'port' de l'interface 'ip'
-    si max_conn > 0, le serveur s'arrête après avoir répondu à max_conn requêtes
+    Ce qui est propre à un visiteur : son identifiant, l'état créé pour lui par la fonction donnée à def_état,
+    et les actions engagées pour lui hors requête, transmises avec sa réponse suivante.
+    """
+
+    def __init__(self, ident: str) -> None:
+        self.ident = ident
+        self.état = _fabrique_état()
+        self.actions = {}
+        self.activité = time.monotonic()
+        # les requêtes d'une même session sont traitées l'une après l'autre par servir
+        self.verrou = threading.Lock()
+        # battements définis pour cette session (ref -> [commande, tempo, actif]), oubliés avec elle
+        self.battements = {}
+        # mode flux : fonction écrivant dans le flux ouvert par la page (None sans flux),
+        # et battements mis en pause faute de flux, reprogrammés à sa réouverture
+        self.flux = None
+        self.verrou_flux = threading.Lock()
+        self.en_pause = []
+
+
+def _purger_sessions(maintenant: float) -> None:
+    """
+    oublie les sessions inactives depuis plus de _durée_session secondes, et les plus anciennes au-delà de _max_sessions
+    (à appeler avec _verrou acquis)
+    """
+    while _sessions:
+        plus_ancienne = next(iter(_sessions.values()))
+        if len(_sessions) <= _max_sessions:
+            if maintenant - plus_ancienne.activité <= _durée_session:
+                break
+            if plus_ancienne.flux is not None:
+                # la page d'une session au flux ouvert est toujours affichée
+                plus_ancienne.activité = maintenant
+                _sessions.move_to_end(plus_ancienne.ident)
+                continue
+        _sessions.popitem(last=False)
+
+
+def _trouver_session(ident: str, créer: bool = True) -> tuple:
+    """
+    renvoie la session d'identifiant ident, et False si elle a dû être créée (identifiant absent, inconnu ou expiré)
+    une session créée reçoit un nouvel identifiant ; sans créer, renvoie None, False pour une session introuvable
+    """
+    maintenant = time.monotonic()
+    with _verrou:
+        _purger_sessions(maintenant)
+        session = _sessions.get(ident) if ident else None
+        if session is not None:
+            session.activité = maintenant
+            _sessions.move_to_end(ident)
+            return session, True
+        if not créer:
+            return None, False
+        session = Session(secrets.token_urlsafe(16))
+        _sessions[session.ident] = session
+        _purger_sessions(maintenant)
+        return session, False
+
+
+def _tampon() -> dict:
+    """
+    renvoie le dictionnaire où inscrire les actions : celui de la requête en cours de traitement
+    (ou du bloc dans_session en cours), ou _actions hors requête
+    """
+    actions = _en_cours.get()
+    return _actions if actions is None else actions
+
+
+def _fusionner(actions: dict, ajouts: dict) -> None:
+    """
+    ajoute à actions celles de ajouts, qui sont plus récentes
+    """
+    for clé, valeur in ajouts.items():
+        if clé == 'cellules' and clé in actions:
+            for nom, rangs in valeur.items():
+                cellules = actions[clé].setdefault(nom, {})
+                for rang, (contenu, classes) in rangs.items():
+                    ancien = cellules.get(rang, (None, None))
+                    cellules[rang] = [
+                        ancien[0] if contenu is None else contenu,
+                        ancien[1] if classes is None else classes,
+                    ]
+        elif isinstance(valeur, dict) and isinstance(actions.get(clé), dict):
+            actions[clé].update(valeur)
+        elif isinstance(valeur, list) and isinstance(actions.get(clé), list):
+            actions[clé].extend(valeur)
+        else:
+            actions[clé] = valeur
+
+
+def _vider_tampon() -> bytes:
+    """
+    renvoie en json les actions de la requête en cours, précédées de celles engagées hors requête
+    (pour tous, puis pour la session), et les oublie
+    """
+    actions = _en_cours.get()
+    session = _session.get()
+    if _actions or (session is not None and session.actions):
+        with _verrou:
+            engagées = dict(_actions)
+            _actions.clear()
+            if session is not None:
+                _fusionner(engagées, session.actions)
+                session.actions = {}
+        _fusionner(engagées, actions)
+        actions = engagées
+    return _sérialiser(actions)
+
+
+def _regrouper(sélecteurs: dict) -> dict:
+    """
+    réunit en un seul sélecteur («a,b») les sélecteurs consécutifs qui reçoivent la même valeur
+    seuls les consécutifs sont réunis : l'ordre d'application, qui compte si des sélecteurs se recouvrent, est préservé
+    """
+    res = {}
+    groupe, valeur = [], None
+    for sélecteur, v in sélecteurs.items():
+        if groupe and v != valeur:
+            res[','.join(groupe)] = valeur
+            groupe = []
+        groupe.append(sélecteur)
+        valeur = v
+    if groupe:
+        res[','.join(groupe)] = valeur
+    return res
+
+
+def _compacter(actions: dict) -> dict:
+    """
+    renvoie les actions au format transmis : sélecteurs regroupés (si _coalescer),
+    cellules de chaque liste indexée aplaties en [rang, contenu, classes, rang, ...] (null : inchangé)
+    """
+    res = dict(actions)
+    if _coalescer:
+        for clé in ('contenu', 'classes', 'valeurs'):
+            if clé in res and len(res[clé]) > 1:
+                res[clé] = _regrouper(res[clé])
+    if 'cellules' in res:
+        res['cellules'] = {
+            nom: [
+                x
+                for rang, (contenu, classes) in rangs.items()
+                for x in (rang, contenu, classes)
+            ]
+            for nom, rangs in res['cellules'].items()
+        }
+    return res
+
+
+def _sérialiser(actions: dict) -> bytes:
+    """
+    renvoie en json les actions au format transmis, en comptant les octets avant et après compactage si _mesurer
+    """
+    données = bytes(
+        json.dumps(_compacter(actions), ensure_ascii=False, separators=(',', ':')),
+        'utf-8',
+    )
+    if _mesurer:
+        avant = len(bytes(json.dumps(actions, ensure_ascii=False), 'utf-8'))
+        with _verrou:
+            _mesures['envois'] += 1
+            _mesures['avant'] += avant
+            _mesures['après'] += len(données)
+    return données
+
+
+def _événement(actions: dict) -> bytes:
     """
+    renvoie les actions sous la forme d'un événement Server-Sent Events
+    """
+    return b'data: ' + _sérialiser(actions) + b'\n\n'
+
+
+def _pousser(session: Session) -> None:
+    """
+    envoie en un seul événement, par le flux de la session, les actions engagées pour elle hors requête
+    sans flux ouvert, elles attendent sa prochaine réponse
+    """
+    with session.verrou_flux:
+        if session.flux is None:
+            return
+        with _verrou:
+            actions = session.actions
+            session.actions = {}
+        if not actions:
+            return
+        try:
+            session.flux(_événement(actions))
+        except OSError:  # la page est partie : les actions attendront
+            session.flux = None
+            with _verrou:
+                _fusionner(actions, session.actions)
+                session.actions = actions
 
-    global _actions
 
-    chemin_js = '/js'  # version future : pour personnaliser le javascript inséré, en changeant l'ordre des «comm ==»
+class _Flux:
+    """
+    réponse ouvrant le flux Server-Sent Events d'une session : après l'en-tête, la connexion reste ouverte
+    et _pousser y écrit un événement par lot d'actions
+    actions : les actions à envoyer dès l'ouverture (nouvelle session à recharger)
+    """
+
+    ENTÊTE = (
+        b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+        b'Access-Control-Allow-Origin: *\r\n\r\n'
+    )
 
-    def interlocuteur_js() -> str:
+    def __init__(self, session: Session, actions: dict) -> None:
+        self.session = session
+        self.actions = actions
+
+    def brancher(self, écrire: callable) -> bool:
+        """
+        envoie l'en-tête par écrire, en fait le flux de la session et y pousse les actions en attente
+        renvoie False si la connexion doit être fermée aussitôt (session oubliée : la page va se recharger)
+        """
+        écrire(self.ENTÊTE)
+        if self.actions:
+            écrire(_événement(self.actions))
+            return False
+        with self.session.verrou_flux:
+            self.session.flux = écrire
+            en_pause, self.session.en_pause = self.session.en_pause, []
+        for ref in en_pause:
+            _programmer(self.session, ref, time.monotonic())
+        _pousser(self.session)
+        return True
+
+    def débrancher(self, écrire: callable) -> None:
         """
-        renvoie le code javascript d'une fonction pour communiquer en xhr/json avec le serveur
+        oublie le flux écrire, fermé par la page, s'il n'a pas déjà été remplacé
         """
-        return """window["__tictacs"] = {};
+        with self.session.verrou_flux:
+            if self.session.flux is écrire:
+                self.session.flux = None
+
+
+def _programmer(session: Session, ref: int, échéance: float) -> None:
+    """
+    programme l'exécution par le serveur du battement ref de la session à l'instant échéance (time.monotonic)
+    """
+    global _battant
+    with _horloge:
+        heapq.heappush(_échéances, (échéance, next(_numéros), session, ref))
+        _horloge.notify()
+        if _battant is None:
+            _battant = threading.Thread(target=_battre, name='battements', daemon=True)
+            _battant.start()
+
+
+def _battre() -> None:
+    """
+    boucle du fil d'exécution des battements en mode flux : exécute chacun à son échéance, dans sa session,
+    pousse ses actions et le reprogramme ; les battements d'une session oubliée ou d'une page rechargée s'arrêtent,
+    ceux d'une session dont la page est partie attendent la réouverture de son flux
+    """
+    while True:
+        with _horloge:
+            while not _échéances or _échéances[0][0] > time.monotonic():
+                _horloge.wait(
+                    _échéances[0][0] - time.monotonic() if _échéances else None
+                )
+            échéance, _, session, ref = heapq.heappop(_échéances)
+        if _sessions.get(session.ident) is not session:
+            continue
+        battement = session.battements.get(ref)
+        if battement is None:  # oublié au rechargement de la page
+            continue
+        if session.flux is None and time.monotonic() - session.activité > _ATTENTE_FLUX:
+            with session.verrou_flux:
+                if session.flux is None:
+                    session.en_pause.append(ref)
+                    continue
+        commande, tempo, actif = battement
+        if actif:
+            try:
+                with dans_session(session), session.verrou:
+                    résultat = commande()
+                    if inspect.iscoroutine(résultat):
+                        asyncio.run(résultat)
+            except Exception:
+                traceback.print_exc()
+                continue
+        _programmer(session, ref, max(échéance + tempo / 1000, time.monotonic()))
+
+
+def _interlocuteur_js() -> str:
+    """
+    renvoie le code javascript d'une fonction pour communiquer en xhr/json avec le serveur
+    (et recevoir les actions poussées par le flux Server-Sent Events en mode flux)
+    """
+    return """window["__tictacs"] = {};
+// la session survit aux rechargements de la page (mais pas à la fermeture de l'onglet)
+window["__session"] = sessionStorage.getItem("__session");
 window["__params"] = {};
+window["__index"] = {};
+window["__file"] = [];
 function namedNodeMapToObject(namedNodeMap) {
   const obj = {};
   for (let i = 0; i < namedNodeMap.length; i++) {
@@ -63,185 +475,1208 @@ function namedNodeMapToObject(namedNodeMap) {
   }
   return obj;
 }
+function appliquer(rep) {
+  if ("session" in rep) {
+    window["__session"] = rep["session"];
+    sessionStorage.setItem("__session", rep["session"]);
+  }
+  if ("recharge" in rep) document.location.reload();
+  if ("flux" in rep && !window["__flux"]) {
+    window["__flux"] = new EventSource(rep["flux"] + "?__session=" + window["__session"]);
+    window["__flux"].onmessage = ev => appliquer(JSON.parse(ev.data));
+  }
+  if ("propage" in rep) document.location = rep["propage"];
+  if ("créer_batt" in rep)
+    for (let ref in rep["créer_batt"])
+      window["__tictacs"][ref] = window.setInterval(() => commande_api("/__tictac", "ref=" + ref), parseInt(rep["créer_batt"][ref]));
+  if ("stop_batt" in rep)
+    for (let ref of rep["stop_batt"])
+      window.clearInterval(window["__tictacs"][ref]);
+  // les modifications de la page attendent le prochain rafraîchissement, où elles sont faites ensemble
+  window["__file"].push(rep);
+  if (window["__file"].length == 1) window.requestAnimationFrame(dessiner);
+}
+function index(nom) {
+  let idx = window["__index"][nom];
+  if (idx.els === null) idx.els = document.querySelectorAll(idx.sel);
+  return idx.els;
+}
+function périmer() {
+  for (let nom in window["__index"]) window["__index"][nom].els = null;
+}
+function dessiner() {
+  let file = window["__file"];
+  window["__file"] = [];
+  for (let rep of file) {
+    if ("index" in rep)
+      for (let nom in rep["index"])
+        window["__index"][nom] = {sel: rep["index"][nom], els: null};
+    if ("contenu" in rep) {
+      for (let obj in rep["contenu"])
+        document.querySelectorAll(obj).forEach(el => el.innerHTML = rep["contenu"][obj]);
+      périmer();
+    }
+    if ("alasuite" in rep) {
+      for (let obj in rep["alasuite"])
+        document.querySelectorAll(obj).forEach(el => {
+          for (cnt of rep["alasuite"][obj])
+            el.innerHTML += cnt;
+        });
+      périmer();
+    }
+    if ("cellules" in rep)
+      for (let nom in rep["cellules"]) {
+        let els = index(nom), c = rep["cellules"][nom];
+        for (let k = 0; k < c.length; k += 3) {
+          if (c[k + 1] !== null) els[c[k]].innerHTML = c[k + 1];
+          if (c[k + 2] !== null) els[c[k]].className = c[k + 2];
+        }
+      }
+    if ("classes" in rep)
+      for (let obj in rep["classes"])
+        document.querySelectorAll(obj).forEach(el => el.classList = rep["classes"][obj]);
+    if ("valeurs" in rep)
+      for (let obj in rep["valeurs"])
+        document.querySelectorAll(obj).forEach(el => el.value = rep["valeurs"][obj]);
+    if ("params" in rep)
+      for (let obj in rep["params"])
+        if (document.getElementById(obj) != null) window["__params"][rep["params"][obj]] = obj;
+    if ("écouter_touches" in rep)
+      if (rep["écouter_touches"]) document.body.onkeyup = function(a) { commande_api(rep["comm_touches"], "touche=" + a.key); };
+      else document.body.onkeypress = undefined;
+    if ("capture_clic" in rep)
+      for (let taf of rep["capture_clic"])
+        document.querySelectorAll(taf[1]).forEach(el => {
+          if (taf[0]) el.onclick = () => {
+              let params = "objet=" + taf[1];
+              if (el.hasAttributes())
+                for (let attr of el.attributes)
+                  params += "&" + attr.name + "=" + attr.value;
+              commande_api(taf[2], params)
+          };
+          else el.onclick = undefined;
+        });
+  }
+}
 function commande_api(api, commande) {
   let req = new XMLHttpRequest();
   let val_param = "";
   for (let param in window["__params"]) val_param += "&" + param + "=" + document.getElementById(window["__params"][param]).value;
+  if (window["__session"]) val_param += "&__session=" + window["__session"];
   if (commande.length == 0) val_param = val_param.substring(1);
   req.open('GET', api + '?' + commande + val_param);
   req.onreadystatechange =
     function() {
       if (req.readyState == 4 && req.status == 200) {
-        let rep = JSON.parse(req.responseText);
-        if ("propage" in rep) document.location = rep["propage"];
-        if ("params" in rep)
-          for (let obj in rep["params"])
-            if (document.getElementById(obj) != null) window["__params"][rep["params"][obj]] = obj;
-        if ("contenu" in rep)
-          for (let obj in rep["contenu"])
-            document.querySelectorAll(obj).forEach(el => el.innerHTML = rep["contenu"][obj]);
-        if ("alasuite" in rep)
-          for (let obj in rep["alasuite"])
-            document.querySelectorAll(obj).forEach(el => {
-              for (cnt of rep["alasuite"][obj])
-                el.innerHTML += cnt;
-            });
-        if ("classes" in rep)
-          for (let obj in rep["classes"])
-            document.querySelectorAll(obj).forEach(el => el.classList = rep["classes"][obj]);
-        if ("valeurs" in rep)
-          for (let obj in rep["valeurs"])
-            document.querySelectorAll(obj).forEach(el => el.value = rep["valeurs"][obj]);
-        if ("créer_batt" in rep)
-          for (let ref in rep["créer_batt"])
-            window["__tictacs"][ref] = window.setInterval(() => commande_api("/__tictac", "ref=" + ref), parseInt(rep["créer_batt"][ref]));
-        if ("stop_batt" in rep)
-          for (let ref of rep["stop_batt"])
-            window.clearInterval(window["__tictacs"][ref]);
-        if ("écouter_touches" in rep)
-          if (rep["écouter_touches"]) document.body.onkeyup = function(a) { commande_api(rep["comm_touches"], "touche=" + a.key); };
-          else document.body.onkeypress = undefined;
-        if ("capture_clic" in rep)
-          for (let taf of rep["capture_clic"])
-            document.querySelectorAll(taf[1]).forEach(el => {
-              if (taf[0]) el.onclick = () => {
-                  let params = "objet=" + taf[1];
-                  if (el.hasAttributes())
-                    for (let attr of el.attributes)
-                      params += "&" + attr.name + "=" + attr.value;
-                  commande_api(taf[2], params)
-              };
-              else el.onclick = undefined;
-            });
+        appliquer(JSON.parse(req.responseText));
       }
     };
   req.send();
 }
 window.addEventListener("DOMContentLoaded", () => commande_api("/__init", "location_pathname=" + document.location.pathname));"""
 
-    def pourcent_dec_get(burl: bytes) -> str:
+
+# octet désigné par chaque %-encodage, et la variante de _pourcent_dec_get où =, & et % restent encodés
+_OCTETS = {
+    bytes(a + b, 'ascii'): bytes([int(a + b, 16)])
+    for a in '0123456789abcdefABCDEF'
+    for b in '0123456789abcdefABCDEF'
+}
+_OCTETS_GET = {
+    hexa: b'%' + hexa if octet in b'=&%' else octet for hexa, octet in _OCTETS.items()
+}
+
+
+def _décoder(burl: bytes, octets: dict = _OCTETS) -> str:
+    """
+    pratique un url->utf-8 en une passe, les %-encodages étant traduits par octets («+» n'est pas changé en « »)
+    lève ValueError si un %-encodage ou l'utf-8 est invalide
+    """
+    if b'%' not in burl:
+        return str(burl, 'utf-8')
+    morceaux = burl.split(b'%')
+    res = [morceaux[0]]
+    try:
+        for morceau in morceaux[1:]:
+            res.append(octets[morceau[:2]])
+            res.append(morceau[2:])
+    except KeyError:
+        raise ValueError('%-encodage invalide') from None
+    return str(b''.join(res), 'utf-8')
+
+
+def _pourcent_dec_get(burl: bytes) -> str:
+    """
+    pratique un url->utf-8, mais =, & et % restent %-encodés, et «+» n'est pas changé en « »
+    """
+    return _décoder(burl, _OCTETS_GET)
+
+
+def _extraire(url: bytes) -> dict:
+    """
+    renvoie un dictionnaire construit à partir des paramètres passés par url (encore %-encodés)
+    le découpage précède le décodage : des «=» «&» et «%» encodés restent dans les clés et valeurs
+    """
+    res = {}
+    for aff in url.split(b'&'):
+        c, _, v = aff.partition(b'=')
+        res[_décoder(c)] = _décoder(v)
+    return res
+
+
+def _typemime(ext: str) -> bytes:
+    """
+    Renvoie le type mime associé à une extension.
+    Catalogue les types mime les plus courants pour les applications visées,
+    les autres contenus sont typés «application/octet-stream».
+    """
+    mime_b = {  # contenus binaire
+        'png': b'image/png',
+        'jpg': b'image/jpeg',
+        'jpeg': b'image/jpeg',
+        'gif': b'image/gif',
+        'ico': b'image/x-icon',
+    }
+    mime_t = {  # contenus textuels
+        'htm': b'text/html',
+        'html': b'text/html',
+        'css': b'text/css',
+        'js': b'application/javascript',
+        'csv': b'text/csv',
+        'txt': b'text/plain',
+        'json': b'appliation/json',
+        'svg': b'image/svg+xml',
+        'xhtml': b'application/xhtml+xml',
+        'xml': b'application/xml',
+    }
+    ext = ext.lower()  # on standardise l'extension
+    if ext in mime_b:
+        return mime_b[ext], False
+    elif ext in mime_t:
+        return mime_t[ext], True
+    else:  # extension non reconnue
+        return b'application/octet-stream', False
+
+
+def _entête_connexion(garder: bool, keep_alive: float, max_requêtes: int) -> bytes:
+    """
+    renvoie l'en-tête Connection à joindre à une réponse, selon que la connexion est gardée ouverte ou non
+    """
+    if garder:
+        return (
+            b'Connection: keep-alive\r\nKeep-Alive: timeout='
+            + bytes(str(int(keep_alive)), 'utf-8')
+            + b', max='
+            + bytes(str(max_requêtes), 'utf-8')
+            + b'\r\n'
+        )
+    return b'Connection: close\r\n'
+
+
+def _empaqueter(
+    contenu: bytes,
+    extension: str,
+    connexion: bytes = b'Connection: close\r\n',
+    entêtes: bytes = b'',
+) -> bytes:
+    """
+    Génère un paquet HTTP à partir de contenu dont le type est donné par extension
+    entêtes : lignes d'en-tête supplémentaires, chacune terminée par CRLF
+    """
+    if type(contenu) == type('') and _typemime(extension)[1]:
+        contenu = bytes(contenu, 'utf-8')
+    return _entête_réponse(extension, len(contenu), connexion, entêtes) + contenu
+
+
+def _entête_réponse(
+    extension: str,
+    longueur: int,
+    connexion: bytes = b'Connection: close\r\n',
+    entêtes: bytes = b'',
+    statut: bytes = b'200 OK',
+) -> bytes:
+    """
+    Génère l'en-tête HTTP (jusqu'à la ligne vide) d'une réponse de longueur octets dont le type est donné par extension
+    """
+    type_mime, textuel = _typemime(extension)
+    encodage = b'; charset=utf-8' if textuel else b''
+    return (
+        b'HTTP/1.1 '
+        + statut
+        + b'\r\nContent-Type: '
+        + type_mime
+        + encodage
+        + b'\r\n'
+        + connexion
+        + entêtes
+        + b'Access-Control-Allow-Origin: *\r\nContent-Length: '
+        + bytes(str(longueur), 'utf-8')
+        + b'\r\n\r\n'
+    )
+
+
+def _erreur(
+    statut: str, texte: str, connexion: bytes = b'Connection: close\r\n'
+) -> bytes:
+    """
+    génère un paquet HTTP d'erreur (404, 400...) contenant un court texte
+    """
+    contenu = bytes(texte + '\r\n\r\n', 'utf-8')
+    return (
+        bytes('HTTP/1.1 ' + statut, 'utf-8')
+        + b'\r\nContent-Type: text/plain; charset=utf-8\r\n'
+        + connexion
+        + b'Content-Length: '
+        + bytes(str(len(contenu)), 'utf-8')
+        + b'\r\n\r\n'
+        + contenu
+    )
+
+
+class _Version:
+    """
+    les validateurs HTTP d'un fichier, tirés de sa date de modification et de sa taille sur le disque
+    entêtes : les lignes d'en-tête à joindre à chaque réponse qui le concerne
+    (la version gzip, qui n'a pas les mêmes octets, a son propre ETag : etag_gzip)
+    """
+
+    def __init__(self, chemin: str, stat: os.stat_result, autres: str = '') -> None:
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        self.extension = chemin.split('.')[-1]
+        self.etag = '"%x-%x"' % self.signature
+        self.etag_gzip = '"%x-%x-gz"' % self.signature
+        self.date = int(stat.st_mtime)
+        if (
+            self.extension.lower() != 'html'
+        ):  # un .html servi n'est pas le fichier du disque
+            autres += 'Accept-Ranges: bytes\r\n'
+        self.autres = autres
+        self.entêtes = self.lignes(self.etag)
+
+    def lignes(self, etag: str) -> bytes:
         """
-        pratique un url->utf-8, mais =, & et % restent %-encodés, et «+» n'est pas changé en « »
+        les lignes d'en-tête d'une réponse portant l'ETag etag
         """
-        res = b''
-        k = 0
-        while k < len(burl):
-            if burl[k] == b'%'[0]:
-                if int(burl[k + 1 : k + 3], 16) in [0x3D, 0x26, 0x25]:
-                    # c'est '&' ou '=' ou '%', on le garde pour la fin
-                    res = res + burl[k : k + 3]
-                else:
-                    # on décode, sauf 3D et 26 et 25
-                    res = res + bytes([int(burl[k + 1 : k + 3], 16)])
-                k = k + 3
-            # elif burl[k] == b'+'[0]:
-            #    res = res + ' '
-            else:
-                res = res + bytes([burl[k]])
-                k = k + 1
-        return str(res, 'utf-8')
+        return bytes(
+            'ETag: '
+            + etag
+            + '\r\nLast-Modified: '
+            + email.utils.formatdate(self.date, usegmt=True)
+            + '\r\nCache-Control: no-cache\r\n'
+            + self.autres,
+            'utf-8',
+        )
+
+    def inchangé(self, entêtes: dict) -> bool:
+        """
+        indique si le client a déjà cette version (If-None-Match, ou à défaut If-Modified-Since)
+        """
+        if 'if-none-match' in entêtes:
+            etags = [
+                e.strip().removeprefix('W/')
+                for e in entêtes['if-none-match'].split(',')
+            ]
+            return self.etag in etags or self.etag_gzip in etags or '*' in etags
+        if 'if-modified-since' in entêtes:
+            try:
+                date = email.utils.parsedate_to_datetime(entêtes['if-modified-since'])
+            except (TypeError, ValueError):
+                return False
+            return self.date <= date.timestamp()
+        return False
+
+
+class _Fichier(_Version):
+    """
+    un fichier tel qu'il est servi (script inséré pour les .html) et sa version gzip pour les contenus textuels qui y gagnent
+    """
+
+    def __init__(self, chemin: str, stat: os.stat_result) -> None:
+        with open(chemin, 'rb') as fichier:
+            contenu = fichier.read()
+        if chemin.split('.')[-1].lower() == 'html':
+            contenu = contenu.replace(b'</head>', b'<script src="/js"></script></head>')
+        self.contenu = contenu
+        self.gzip = None
+        if _typemime(chemin.split('.')[-1])[1] and len(contenu) > 256:
+            compressé = gzip.compress(contenu, mtime=0)
+            if len(compressé) < len(contenu):
+                self.gzip = compressé
+        super().__init__(
+            chemin, stat, 'Vary: Accept-Encoding\r\n' if self.gzip is not None else ''
+        )
+        self.entêtes_gzip = self.lignes(self.etag_gzip)
+
+    def taille(self) -> int:
+        return len(self.contenu) + (len(self.gzip) if self.gzip is not None else 0)
+
+
+class _Envoi:
+    """
+    réponse dont le corps est une plage d'un fichier ouvert : l'en-tête est envoyé, puis la plage par sendfile,
+    sans que le fichier passe par la mémoire du processus ; le fichier est fermé une fois la réponse envoyée
+    """
+
+    def __init__(self, entête: bytes, fichier, début: int, longueur: int) -> None:
+        self.entête = entête
+        self.fichier = fichier
+        self.début = début
+        self.longueur = longueur
+
+    def envoyer(self, t: socket.socket) -> None:
+        try:
+            t.sendall(self.entête)
+            if self.longueur:
+                t.sendfile(self.fichier, self.début, self.longueur)
+        finally:
+            self.fichier.close()
+
+    async def envoyer_async(self, écrivain: asyncio.StreamWriter) -> None:
+        try:
+            écrivain.write(self.entête)
+            await écrivain.drain()
+            if self.longueur:
+                await asyncio.get_running_loop().sendfile(
+                    écrivain.transport, self.fichier, self.début, self.longueur
+                )
+        finally:
+            self.fichier.close()
+
+
+def _plage(valeur: str, taille: int) -> tuple:
+    """
+    renvoie (début, longueur) de la plage demandée par un en-tête Range, (taille, 0) si elle est hors du fichier,
+    ou None si l'en-tête est à ignorer (plusieurs plages, unité inconnue, mal formé)
+    """
+    unité, _, plages = valeur.partition('=')
+    début, tiret, fin = plages.strip().partition('-')
+    if unité.strip().lower() != 'bytes' or ',' in plages or not tiret:
+        return None
+    if début.isdigit() and (fin.isdigit() or not fin):
+        if fin and int(début) > int(fin):
+            return None
+        début = int(début)
+        fin = int(fin) if fin else taille - 1
+    elif not début and fin.isdigit():  # les «fin» derniers octets
+        début = max(taille - int(fin), 0)
+        fin = taille - 1 if int(fin) else -1
+    else:
+        return None
+    if début >= taille or début > fin:
+        return taille, 0
+    return début, min(fin, taille - 1) - début + 1
+
+
+def _envoi_fichier(
+    chemin: str, connexion: bytes, entêtes: dict, fichier, stat: os.stat_result
+) -> bytes | _Envoi:
+    """
+    répond pour le fichier ouvert «fichier» sans le lire : 304, 416, ou _Envoi de tout le fichier ou de la plage demandée (206)
+    """
+    version = _Version(chemin, stat)
+    taille = stat.st_size
+    if version.inchangé(entêtes):
+        fichier.close()
+        return b'HTTP/1.1 304 Not Modified\r\n' + version.entêtes + connexion + b'\r\n'
+    plage = None
+    if 'range' in entêtes and entêtes.get('if-range', version.etag) == version.etag:
+        plage = _plage(entêtes['range'], taille)
+    if plage is None:
+        entête = _entête_réponse(version.extension, taille, connexion, version.entêtes)
+        return _Envoi(entête, fichier, 0, taille)
+    début, longueur = plage
+    if longueur == 0:
+        fichier.close()
+        return _erreur(
+            '416 Range Not Satisfiable',
+            'Plage hors du fichier !',
+            connexion + bytes('Content-Range: bytes */%d\r\n' % taille, 'utf-8'),
+        )
+    entête = _entête_réponse(
+        version.extension,
+        longueur,
+        connexion,
+        version.entêtes
+        + bytes(
+            'Content-Range: bytes %d-%d/%d\r\n' % (début, début + longueur - 1, taille),
+            'utf-8',
+        ),
+        b'206 Partial Content',
+    )
+    return _Envoi(entête, fichier, début, longueur)
+
+
+def _fichier(chemin: str, stat: os.stat_result) -> _Fichier:
+    """
+    renvoie le fichier depuis le cache, relu si il a changé sur le disque depuis sa mise en cache
+    lève OSError s'il ne peut être lu
+    """
+    global _taille_cache
+    with _verrou_cache:
+        fichier = _cache.get(chemin)
+        if fichier is not None and fichier.signature == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            _cache.move_to_end(chemin)
+            return fichier
+    fichier = _Fichier(chemin, stat)
+    with _verrou_cache:
+        if chemin in _cache:
+            _taille_cache -= _cache.pop(chemin).taille()
+        if fichier.taille() <= _budget_cache:
+            _cache[chemin] = fichier
+            _taille_cache += fichier.taille()
+            _purger_cache()
+    return fichier
+
+
+def _purger_cache() -> None:
+    """
+    oublie les fichiers les moins récemment servis jusqu'à respecter le budget (à appeler avec _verrou_cache acquis)
+    """
+    global _taille_cache
+    while _taille_cache > _budget_cache:
+        _, fichier = _cache.popitem(last=False)
+        _taille_cache -= fichier.taille()
+
+
+def _accepte_gzip(entêtes: dict) -> bool:
+    """
+    indique si l'en-tête Accept-Encoding autorise une réponse compressée avec gzip
+    """
+    for codage in entêtes.get('accept-encoding', '').split(','):
+        nom, _, paramètres = codage.partition(';')
+        if nom.strip().lower() in ('gzip', '*'):
+            q = paramètres.strip().removeprefix('q=')
+            try:
+                return not q or float(q) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def _gen_fichier(
+    comm: str, connexion: bytes = b'Connection: close\r\n', entêtes: dict = None
+) -> bytes | _Envoi:
+    """
+    génère un paquet HTTP à partir du chemin du fichier, compressé si le client l'accepte
+    ou 304 si le client a déjà la version actuelle (entêtes : en-têtes de la requête)
+    les gros fichiers (très gros s'ils sont textuels) et les demandes de plage (Range) hors .html ne passent pas par le cache :
+    la réponse est alors un _Envoi, à transmettre par sendfile
+    """
+    if entêtes is None:
+        entêtes = {}
+    try:
+        extension = comm.split('.')[-1]
+        if extension.lower() != 'html':
+            ouvert = open(comm, 'rb')
+            stat = os.fstat(ouvert.fileno())
+            seuil = _SEUIL_ENVOI_TEXTE if _typemime(extension)[1] else _SEUIL_ENVOI
+            if 'range' in entêtes or stat.st_size > seuil:
+                return _envoi_fichier(comm, connexion, entêtes, ouvert, stat)
+            ouvert.close()
+        else:
+            stat = os.stat(comm)
+        fichier = _fichier(comm, stat)
+    except OSError:  # s'il n'existe pas (ou autre erreur !)
+        return _erreur('404 Not Found', 'Pas trouvé !', connexion)
+    compressé = fichier.gzip is not None and _accepte_gzip(entêtes)
+    if fichier.inchangé(entêtes):
+        return (
+            b'HTTP/1.1 304 Not Modified\r\n'
+            + (fichier.entêtes_gzip if compressé else fichier.entêtes)
+            + connexion
+            + b'\r\n'
+        )
+    if compressé:
+        return _empaqueter(
+            fichier.gzip,
+            fichier.extension,
+            connexion,
+            fichier.entêtes_gzip + b'Content-Encoding: gzip\r\n',
+        )
+    return _empaqueter(fichier.contenu, fichier.extension, connexion, fichier.entêtes)
+
+
+class _Chrono:
+    """
+    relevé d'une requête pour les métriques : route, durée de chacune de ses étapes, statut et octets de la réponse
+    """
+
+    __slots__ = ('route', 'fichier', 'étapes', 'statut', 'octets')
+
+    def __init__(self) -> None:
+        self.route = '(mal formée)'
+        self.fichier = False
+        self.étapes = {}
+        self.statut = 0
+        self.octets = 0
+
+    def noter(self, étape: str, début: float) -> float:
+        """
+        ajoute à l'étape le temps écoulé depuis début et renvoie l'instant présent
+        """
+        maintenant = time.perf_counter()
+        self.étapes[étape] = self.étapes.get(étape, 0.0) + maintenant - début
+        return maintenant
+
+    def relever(self, réponse: bytes | _Envoi | _Flux) -> None:
+        """
+        relève le statut et la taille de la réponse (un flux compte pour un 200 sans octets)
+        """
+        if isinstance(réponse, _Flux):
+            self.statut = 200
+        elif isinstance(réponse, _Envoi):
+            self.statut = int(réponse.entête[9:12])
+            self.octets = len(réponse.entête) + réponse.longueur
+        else:
+            self.statut = int(réponse[9:12])
+            self.octets = len(réponse)
+
+
+class _Métriques:
+    """
+    histogrammes des durées par route et par étape, requêtes par route et statut, erreurs et octets envoyés par route
+    les fichiers introuvables partagent une seule route, pour que des chemins quelconques ne multiplient pas les séries
+    """
+
+    BORNES = (
+        0.0001,
+        0.00025,
+        0.0005,
+        0.001,
+        0.0025,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1,
+        2.5,
+        5,
+    )
+
+    def __init__(self) -> None:
+        self.verrou = threading.Lock()
+        self.histogrammes = {}  # (route, étape) -> [requêtes par tranche de BORNES, puis au-delà, somme des durées]
+        self.requêtes = collections.Counter()  # (route, statut) -> requêtes
+        self.erreurs = (
+            collections.Counter()
+        )  # route -> réponses en erreur (statut >= 400)
+        self.octets = collections.Counter()  # route -> octets envoyés
+
+    def enregistrer(self, chrono: _Chrono) -> None:
+        route = chrono.route
+        if chrono.fichier and chrono.statut == 404:
+            route = '(introuvable)'
+        with self.verrou:
+            for étape, durée in chrono.étapes.items():
+                histogramme = self.histogrammes.get((route, étape))
+                if histogramme is None:
+                    histogramme = self.histogrammes[(route, étape)] = [0] * (
+                        len(self.BORNES) + 1
+                    ) + [0.0]
+                histogramme[bisect.bisect_left(self.BORNES, durée)] += 1
+                histogramme[-1] += durée
+            self.requêtes[(route, chrono.statut)] += 1
+            if chrono.statut >= 400:
+                self.erreurs[route] += 1
+            self.octets[route] += chrono.octets
+
+    def texte(self) -> str:
+        """
+        renvoie les mesures au format d'exposition texte de Prometheus
+        """
+
+        def étiquette(valeur: str) -> str:
+            return valeur.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        with self.verrou:
+            lignes = [
+                '# HELP htinter_requetes_total Requêtes servies, par route et statut.',
+                '# TYPE htinter_requetes_total counter',
+            ]
+            for (route, statut), n in sorted(self.requêtes.items()):
+                lignes.append(
+                    f'htinter_requetes_total{{route="{étiquette(route)}",statut="{statut}"}} {n}'
+                )
+            lignes += [
+                '# HELP htinter_erreurs_total Réponses de statut 400 ou plus, par route.',
+                '# TYPE htinter_erreurs_total counter',
+            ]
+            for route, n in sorted(self.erreurs.items()):
+                lignes.append(
+                    f'htinter_erreurs_total{{route="{étiquette(route)}"}} {n}'
+                )
+            lignes += [
+                '# HELP htinter_octets_envoyes_total Octets des réponses envoyées, par route.',
+                '# TYPE htinter_octets_envoyes_total counter',
+            ]
+            for route, n in sorted(self.octets.items()):
+                lignes.append(
+                    f'htinter_octets_envoyes_total{{route="{étiquette(route)}"}} {n}'
+                )
+            lignes += [
+                '# HELP htinter_duree_secondes Durée des étapes du traitement des requêtes, par route.',
+                '# TYPE htinter_duree_secondes histogram',
+            ]
+            for (route, étape), histogramme in sorted(self.histogrammes.items()):
+                série = f'route="{étiquette(route)}",etape="{étape}"'
+                cumul = 0
+                for borne, n in zip(self.BORNES + ('+Inf',), histogramme):
+                    cumul += n
+                    lignes.append(
+                        f'htinter_duree_secondes_bucket{{{série},le="{borne}"}} {cumul}'
+                    )
+                lignes.append(
+                    f'htinter_duree_secondes_sum{{{série}}} {histogramme[-1]}'
+                )
+                lignes.append(f'htinter_duree_secondes_count{{{série}}} {cumul}')
+        return '\n'.join(lignes) + '\n'
+
+
+class _Profilage:
+    """
+    profilage des appels d'api lents : un appel sur «période» est exécuté sous cProfile, et ses statistiques sont
+    gardées s'il a duré au moins «seuil» secondes ; un appel lent non profilé est tout de même noté, avec ses paramètres
+    un appel n'est jamais rejoué (il agit sur l'état de la session) : seul l'échantillonnage donne des profils
+    les «garder» relevés les plus récents sont conservés dans le dossier «dossier»
+    """
 
-    def extraire(url: str) -> dict:
+    def __init__(self, seuil: float, dossier: str, période: int, garder: int) -> None:
+        os.makedirs(dossier, exist_ok=True)
+        self.seuil = seuil
+        self.dossier = dossier
+        self.période = max(période, 1)
+        self.garder = garder
+        self.appels = itertools.count()
+        self.relevés = itertools.count()
+        self.profileur = (
+            threading.Lock()
+        )  # un seul profileur peut être actif à la fois dans le processus
+
+    def appeler(self, comm: str, params: dict, fnct: callable) -> object:
         """
-        renvoie un dictionnaire construit à partir des paramètres passés par url
+        exécute fnct (sans paramètre), profilée si c'est son tour et qu'aucun autre appel ne l'est, et relève l'appel s'il est lent
         """
-        res = {}
-        lc = url.split('&')
-        for aff in lc:
-            if '=' in aff:
-                c, v = aff.split('=', 1)
+        profileur = None
+        if next(self.appels) % self.période == 0 and self.profileur.acquire(
+            blocking=False
+        ):
+            profileur = cProfile.Profile()
+        début = time.perf_counter()
+        try:
+            if profileur is None:
+                résultat = fnct()
             else:
-                c = aff
-                v = ''
-            # on décode les «=» «&» et «%» qui étaient encore encodés
-            c = (
-                c.replace('%3D', '=')
-                .replace('%3d', '=')
-                .replace('%26', '&')
-                .replace('%25', '%')
-            )
-            v = (
-                v.replace('%3D', '=')
-                .replace('%3d', '=')
-                .replace('%26', '&')
-                .replace('%25', '%')
+                try:
+                    résultat = profileur.runcall(fnct)
+                finally:
+                    self.profileur.release()
+        finally:
+            durée = time.perf_counter() - début
+        if not inspect.isawaitable(
+            résultat
+        ):  # sinon, relevé une fois la coroutine attendue
+            self.lent(comm, params, durée, profileur)
+        return résultat
+
+    def lent(
+        self, comm: str, params: dict, durée: float, profileur: cProfile.Profile = None
+    ) -> None:
+        """
+        relève l'appel s'il a duré au moins self.seuil secondes
+        """
+        if durée >= self.seuil:
+            try:
+                self.relever(comm, params, durée, profileur)
+            except OSError:
+                traceback.print_exc()
+
+    def relever(
+        self, comm: str, params: dict, durée: float, profileur: cProfile.Profile
+    ) -> None:
+        """
+        écrit le relevé d'un appel lent (paramètres et durée en .json, statistiques en .prof s'il a été profilé,
+        à lire avec pstats), puis oublie les relevés les plus anciens au-delà de self.garder
+        """
+        base = os.path.join(
+            self.dossier,
+            '%s-%06d%s'
+            % (
+                time.strftime('%Y%m%d-%H%M%S'),
+                next(self.relevés) % 1000000,
+                re.sub(r'\W+', '_', comm),
+            ),
+        )
+        if profileur is not None:
+            profileur.dump_stats(base + '.prof')
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(
+                {
+                    'chemin': comm,
+                    'params': params,
+                    'durée': durée,
+                    'profil': profileur is not None,
+                },
+                f,
+                ensure_ascii=False,
             )
-            res[c] = v
+        relevés = sorted(
+            nom for nom in os.listdir(self.dossier) if nom.endswith('.json')
+        )
+        for nom in relevés[: max(len(relevés) - self.garder, 0)]:
+            for extension in ('.json', '.prof'):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.dossier, nom[:-5] + extension))
+
+
+class _Requête:
+    """
+    une requête GET analysée : chemin et paramètres décodés, version HTTP, en-têtes (noms en minuscules)
+    """
 
-        return res
+    def __init__(
+        self, chemin: str, params: dict, version: bytes, entêtes: dict
+    ) -> None:
+        self.chemin = chemin
+        self.params = params
+        self.version = version
+        self.entêtes = entêtes
 
-    def typemime(ext: str) -> bytes:
+    def veut_fermer(self) -> bool:
         """
-        Renvoie le type mime associé à une extension.
-        Catalogue les types mime les plus courants pour les applications visées,
-        les autres contenus sont typés «application/octet-stream».
+        indique si le client demande la fermeture de la connexion après cette requête
+        («Connection: close», ou HTTP/1.0 sans «Connection: keep-alive»)
         """
-        mime_b = {  # contenus binaire
-            'png': b'image/png',
-            'jpg': b'image/jpeg',
-            'jpeg': b'image/jpeg',
-            'gif': b'image/gif',
-            'ico': b'image/x-icon',
-        }
-        mime_t = {  # contenus textuels
-            'htm': b'text/html',
-            'html': b'text/html',
-            'css': b'text/css',
-            'js': b'application/javascript',
-            'csv': b'text/csv',
-            'json': b'appliation/json',
-            'svg': b'image/svg+xml',
-            'xhtml': b'application/xhtml+xml',
-            'xml': b'application/xml',
-        }
-        ext = ext.lower()  # on standardise l'extension
-        if ext in mime_b:
-            return mime_b[ext], False
-        elif ext in mime_t:
-            return mime_t[ext], True
-        else:  # extension non reconnue
-            return b'application/octet-stream', False
-
-    def empaqueter(contenu: bytes, extension: str) -> bytes:
-        """
-        Génère un paquet HTTP à partir de contenu dont le type est donné par extension
-        """
-        type_mime, textuel = typemime(extension)
-        if textuel:
-            encodage = b'; charset=utf-8'
-            if type(contenu) == type(''):
-                contenu = bytes(contenu, 'utf-8')
-        else:
-            encodage = b''
-        return (
-            b'HTTP/1.1 200 OK\r\nContent-Type: '
-            + type_mime
-            + encodage
-            + b'\r\nConnection: close\r\nAccess-Control-Allow-Origin: *\r\nContent-Length: '
-            + bytes(str(len(contenu)), 'utf-8')
-            + b'\r\n\r\n'
-            + contenu
+        connexion = self.entêtes.get('connection', '').lower()
+        if self.version == b'HTTP/1.0':
+            return connexion != 'keep-alive'
+        return connexion == 'close'
+
+
+def _analyser(req: bytes) -> _Requête:
+    """
+    analyse en une passe une requête complète (jusqu'à la ligne vide exclue) : ligne de requête, paramètres, en-têtes
+    renvoie None si ce n'est pas une requête GET ou si elle est mal formée
+    """
+    lignes = req.split(b'\r\n')
+    méthode, _, reste = lignes[0].partition(b' ')
+    cible, _, version = reste.partition(b' ')
+    if méthode != b'GET' or not reste:  # ce n'est pas une requête GET
+        return None
+    chemin, _, requête = cible.partition(b'?')
+    entêtes = {}
+    for ligne in lignes[1:]:
+        nom, deux_points, valeur = ligne.partition(b':')
+        if deux_points:
+            entêtes[str(nom.strip().lower(), 'latin-1')] = str(
+                valeur.strip(), 'latin-1'
+            )
+    try:
+        return _Requête(
+            _pourcent_dec_get(chemin),
+            _extraire(requête),
+            version.rstrip(),
+            entêtes,
+        )
+    except ValueError:  # %-encodage ou utf-8 invalide
+        return None
+
+
+def _cible(comm: str, params: dict) -> callable:
+    """
+    renvoie la fonction (sans paramètre) à appeler pour répondre à comm : battement, api ou init
+    renvoie None si comm désigne un fichier
+    """
+    # ordre de traitement : tictac, touches, api, init, fichier
+    if comm == '/__tictac':
+        return lambda: _battement(int(params['ref']))
+    if comm in _catalogue:
+        return lambda: _catalogue[comm](comm, params)
+    if comm == '/__init':  # placé après le catalogue pour pouvoir court-circuiter
+        return lambda: None
+    return None
+
+
+def _battement(ref: int) -> object:
+    """
+    exécute le battement ref, demandé par la page, s'il existe et est actif dans la session de la requête (ou hors session)
+    """
+    session = _session.get()
+    battement = (session.battements if session.ident else _battements).get(ref)
+    if battement is not None and battement[2]:
+        return battement[0]()
+
+
+def _ouvrir_session(comm: str, params: dict) -> tuple:
+    """
+    retire des paramètres l'identifiant de session envoyé par la page, et renvoie la session et le tampon d'actions de départ :
+    seul /__init crée une session, dont il communique le nouvel identifiant à la page ;
+    un autre appel portant un identifiant inconnu ou expiré fait recharger la page
+    """
+    ident = params.pop('__session', '')
+    if comm != '/__init':
+        if not ident:
+            # appel hors page (sans identifiant) : état éphémère, sans session gardée en mémoire
+            return Session(''), {}
+        session, connue = _trouver_session(ident, créer=False)
+        if not connue:
+            # identifiant inconnu ou expiré : la page se recharge, et son /__init lui ouvre une session
+            return Session(''), {'recharge': True}
+        return session, {}
+    session, connue = _trouver_session(ident)
+    actions = {}
+    if not connue:
+        actions['session'] = session.ident
+    else:
+        # page rechargée : les battements de la précédente s'arrêtent, l'init redéfinit les siens
+        session.battements = {}
+        with session.verrou_flux:
+            session.en_pause = []
+    if _flux:
+        actions['flux'] = _CHEMIN_FLUX
+    return session, actions
+
+
+def _ouvrir_flux(params: dict) -> bytes | _Flux:
+    """
+    répond à l'ouverture du flux d'une session : _Flux, ou 400 sans identifiant (la page ne réessaie pas)
+    """
+    if not params.get('__session'):
+        return _erreur('400 Bad Request', 'Session manquante !')
+    return _Flux(*_ouvrir_session(_CHEMIN_FLUX, params))
+
+
+def _exécuter(fnct: callable) -> None:
+    """
+    appelle fnct (sans paramètre) et, si c'est une coroutine, l'exécute jusqu'au bout
+    """
+    résultat = fnct()
+    if inspect.iscoroutine(résultat):
+        asyncio.run(résultat)
+
+
+def _aiguiller(requête: _Requête, connexion: bytes) -> tuple:
+    """
+    début commun à _répondre et _répondre_async : renvoie (réponse, None) pour une requête servie sans appel
+    (mal formée, script, flux, métriques), (None, fnct) pour un appel et (None, None) pour un fichier
+    """
+    if requête is None:
+        return _erreur('400 Bad Request', 'Requête mal formée !'), None
+    comm, params = requête.chemin, requête.params
+    chrono = _chrono.get()
+    if chrono is not None:
+        chrono.route = comm
+
+    if comm == _CHEMIN_JS:
+        return _empaqueter(bytes(_interlocuteur_js(), 'utf-8'), 'js', connexion), None
+
+    if comm == _CHEMIN_FLUX:
+        return _ouvrir_flux(params), None
+
+    if comm == _CHEMIN_MÉTRIQUES and _métriques is not None:
+        return _empaqueter(bytes(_métriques.texte(), 'utf-8'), 'txt', connexion), None
+
+    fnct = _cible(comm, params)
+    if fnct is None and chrono is not None:
+        chrono.fichier = True
+    return None, fnct
+
+
+@contextlib.contextmanager
+def _appel(comm: str, params: dict):
+    """
+    contexte commun à _répondre et _répondre_async pendant l'appel d'une fonction : la session de la requête
+    et son tampon d'actions ; donne la session, ou None si la page doit se recharger (rien n'est alors appelé)
+    """
+    session, actions = _ouvrir_session(comm, params)
+    jeton = _en_cours.set(actions)
+    jeton_session = _session.set(session)
+    try:
+        yield None if 'recharge' in actions else session
+    finally:
+        _session.reset(jeton_session)
+        _en_cours.reset(jeton)
+
+
+def _réponse_appel(connexion: bytes) -> bytes:
+    """
+    renvoie le paquet HTTP de la réponse à un appel : les actions de son tampon, en json
+    """
+    chrono = _chrono.get()
+    début = time.perf_counter() if chrono is not None else 0.0
+    données = _vider_tampon()
+    if chrono is not None:
+        chrono.noter('serialisation', début)
+    return _empaqueter(données, 'json', connexion)
+
+
+async def _verrouiller(verrou: threading.Lock) -> None:
+    """
+    acquiert verrou sans bloquer la boucle asyncio : il peut être tenu par un autre fil d'exécution (battements)
+    ou par une autre tâche, dont l'appel dans la même session attend une coroutine
+    """
+    while not verrou.acquire(blocking=False):
+        await asyncio.sleep(0.001)
+
+
+def _répondre(requête: _Requête, connexion: bytes) -> bytes | _Envoi | _Flux:
+    """
+    traite une requête analysée (None si elle est mal formée) et renvoie le paquet HTTP de la réponse (ou l'_Envoi d'un fichier, le _Flux d'une session)
+    une fonction appelée peut être une coroutine : elle est alors exécutée jusqu'au bout
+    """
+    réponse, fnct = _aiguiller(requête, connexion)
+    if réponse is not None:
+        return réponse
+    if fnct is None:  # on cherche le fichier, _gen_fichier se charge du 404
+        return _gen_fichier('.' + requête.chemin, connexion, requête.entêtes)
+
+    comm, params = requête.chemin, requête.params
+    chrono = _chrono.get()
+    with _appel(comm, params) as session:
+        if session is not None:
+            with session.verrou:
+                début = time.perf_counter() if chrono is not None else 0.0
+                profilage = _profilage
+                if profilage is not None and comm in _catalogue:
+                    profilage.appeler(comm, params, lambda: _exécuter(fnct))
+                else:
+                    _exécuter(fnct)
+                if chrono is not None:
+                    chrono.noter('appel', début)
+        return _réponse_appel(connexion)
+
+
+async def _répondre_async(
+    requête: _Requête, connexion: bytes
+) -> bytes | _Envoi | _Flux:
+    """
+    comme _répondre, mais attend les coroutines dans la boucle asyncio en cours
+    et lit les fichiers dans un fil d'exécution à part pour ne pas bloquer les autres clients
+    """
+    réponse, fnct = _aiguiller(requête, connexion)
+    if réponse is not None:
+        return réponse
+    if fnct is None:
+        return await asyncio.to_thread(
+            _gen_fichier, '.' + requête.chemin, connexion, requête.entêtes
         )
 
-    def gen_fichier(comm: str) -> bytes:
+    # chaque connexion est servie par sa propre tâche, donc dans son propre contexte :
+    # les tampons d'actions de requêtes simultanées restent séparés
+    comm, params = requête.chemin, requête.params
+    chrono = _chrono.get()
+    with _appel(comm, params) as session:
+        if session is not None:
+            await _verrouiller(session.verrou)
+            try:
+                début = time.perf_counter() if chrono is not None else 0.0
+                profilage = _profilage
+                if profilage is not None and comm in _catalogue:
+                    # seule la partie synchrone est profilée : la suite s'exécute entrelacée avec les autres tâches,
+                    # et n'est que chronométrée
+                    début_appel = time.perf_counter()
+                    résultat = profilage.appeler(comm, params, fnct)
+                    if inspect.isawaitable(résultat):
+                        await résultat
+                        profilage.lent(comm, params, time.perf_counter() - début_appel)
+                elif inspect.isawaitable(résultat := fnct()):
+                    await résultat
+                if chrono is not None:
+                    chrono.noter('appel', début)
+            finally:
+                session.verrou.release()
+        return _réponse_appel(connexion)
+
+
+def _garder(
+    requête: _Requête, requêtes: int, keep_alive: float, max_requêtes: int
+) -> bool:
+    """
+    indique si une connexion reste ouverte après avoir répondu à sa requêtes-ième requête (servir et servir_async)
+    """
+    return (
+        keep_alive > 0
+        and requêtes < max_requêtes
+        and requête is not None
+        and not requête.veut_fermer()
+    )
+
+
+def _erreur_interne() -> bytes:
+    """
+    signale l'exception en cours et renvoie la réponse 500 qui remplace celle de la requête fautive :
+    elle ne doit ni bloquer sa connexion ni arrêter le serveur
+    """
+    traceback.print_exc()
+    return _erreur('500 Internal Server Error', 'Erreur interne !')
+
+
+def _clore_relevé(chrono: _Chrono, début: float) -> None:
+    """
+    termine le relevé d'une requête, commencée à l'instant début, et l'ajoute aux métriques
+    """
+    chrono.noter('total', début)
+    if _métriques is not None:
+        _métriques.enregistrer(chrono)
+
+
+def servir(
+    ip: str = '127.0.0.1',
+    port: int = 5080,
+    max_conn: int = -1,
+    keep_alive: float = 5,
+    max_requêtes: int = 100,
+    travailleurs: int = 0,
+) -> None:
+    """
+    appel bloquant démarrant un serveur sur le port 'port' de l'interface 'ip'
+    si max_conn > 0, le serveur s'arrête après avoir répondu à max_conn requêtes
+    keep_alive : durée en secondes pendant laquelle une connexion inactive est gardée ouverte (0 : une requête par connexion)
+    max_requêtes : nombre maximal de requêtes servies sur une même connexion
+    travailleurs : si > 0, les requêtes sont traitées en parallèle par autant de fils d'exécution,
+                   chaque requête ayant son propre tampon d'actions
+    """
+
+    def fermer(t: socket.socket) -> None:
         """
-        génère un paquet HTTP à partir du chemin du fichier
+        ferme proprement une connexion et l'oublie
         """
-        extension = comm.split('.')[-1]
+        état = connexions.pop(t)
+        if not état['occupée']:
+            sel.unregister(t)
+        if état['flux'] is not None:
+            flux, écrire = état['flux']
+            flux.débrancher(écrire)
         try:
-            with open(comm, 'rb') as fichier:
-                contenu = fichier.read()
-        except:  # s'il n'existe pas (ou autre erreur !)
-            return bytes(
-                'HTTP/1.1 404 Not Found\r\nContent-Type: text/plain; charset=utf-8\r\nConnection: close\r\nContent-Length:17\r\n\r\nPas trouvé !\r\n\r\n',
-                'utf-8',
-            )
-        else:
-            if extension.lower() == 'html':
-                contenu = contenu.replace(
-                    b'</head>', b'<script src="/js"></script></head>'
+            t.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        t.close()
+
+    def traiter(t: socket.socket, req: bytes, requêtes: int, chrono: _Chrono) -> None:
+        """
+        analyse et répond à la requêtes-ième requête de la connexion t, puis rend la connexion à la boucle du serveur
+        (exécuté par un travailleur si travailleurs > 0)
+        chrono : relevé de la requête si les métriques sont actives, None sinon
+        """
+        if chrono is not None:
+            début = time.perf_counter()
+            jeton = _chrono.set(chrono)
+        requête = _analyser(req)
+        if chrono is not None:
+            chrono.noter('analyse', début)
+        garder = _garder(requête, requêtes, keep_alive, max_requêtes)
+        flux = None
+        try:
+            try:
+                réponse = _répondre(
+                    requête, _entête_connexion(garder, keep_alive, max_requêtes)
+                )
+            except Exception:
+                garder = False
+                réponse = _erreur_interne()
+            if chrono is not None:
+                chrono.relever(réponse)
+                envoi = time.perf_counter()
+            if isinstance(réponse, _Flux):
+                écrire = t.sendall
+                if réponse.brancher(écrire):
+                    flux = (réponse, écrire)
+                garder = False
+            elif isinstance(réponse, _Envoi):
+                réponse.envoyer(t)
+            else:
+                t.sendall(réponse)
+            if chrono is not None and flux is None:
+                chrono.noter('envoi', envoi)
+        except OSError:
+            garder = False
+        except Exception:
+            traceback.print_exc()
+            garder = False
+        if chrono is not None:
+            _chrono.reset(jeton)
+            _clore_relevé(chrono, début)
+        rendues.put((t, garder, flux))
+        if groupe is not None:
+            réveil_envoi.send(b'.')
+
+    def lancer(t: socket.socket) -> None:
+        """
+        extrait la prochaine requête complète reçue sur t, s'il y en a une, et la fait traiter
+        la connexion quitte le sélecteur le temps du traitement
+        """
+        nonlocal max_conn
+        état = connexions[t]
+        reçu = état['reçu']
+        # la recherche de la ligne vide reprend où la précédente s'est arrêtée
+        fin = reçu.find(b'\r\n\r\n', état['vu'])
+        # la taille limite vaut aussi pour une requête arrivée entière en une fois
+        if (fin if fin >= 0 else len(reçu)) > _TAILLE_MAX_REQUÊTE:
+            try:
+                t.sendall(
+                    _erreur(
+                        '431 Request Header Fields Too Large',
+                        'Requête trop longue !',
+                    )
                 )
-            return empaqueter(contenu, extension)
+            except OSError:
+                pass
+            fermer(t)
+            return
+        if fin < 0:
+            état['vu'] = max(len(reçu) - 3, 0)
+            return
+        if max_conn == 0:
+            return
+        req = bytes(reçu[:fin])
+        del reçu[: fin + 4]
+        état['vu'] = 0
+        chrono = None
+        if _métriques is not None:
+            # réception : du premier octet de la requête à sa ligne vide
+            chrono = _Chrono()
+            chrono.noter('reception', état['arrivée'])
+            état['arrivée'] = (
+                time.perf_counter()
+            )  # requête suivante déjà entamée (pipelining)
+        max_conn = min(max_conn, max(max_conn - 1, 0))
+        état['requêtes'] += 1
+        sel.unregister(t)
+        état['occupée'] = True
+        if groupe is None:
+            traiter(t, req, état['requêtes'], chrono)
+        else:
+            groupe.submit(traiter, t, req, état['requêtes'], chrono)
+
+    def reprendre() -> None:
+        """
+        récupère les connexions dont la réponse est partie : les ferme ou les remet en attente de la requête suivante
+        """
+        while not rendues.empty():
+            t, garder, flux = rendues.get()
+            if flux is not None:
+                # flux ouvert : la connexion ne sert plus qu'à détecter le départ de la page
+                état = connexions[t]
+                état['occupée'] = False
+                état['flux'] = flux
+                sel.register(t, selectors.EVENT_READ)
+                continue
+            if not garder:
+                connexions[t]['occupée'] = False
+                sel.register(t, selectors.EVENT_READ)
+                fermer(t)
+                continue
+            état = connexions[t]
+            état['occupée'] = False
+            état['activité'] = time.monotonic()
+            sel.register(t, selectors.EVENT_READ)
+            lancer(t)  # requête suivante déjà reçue (pipelining)
 
     # mise en place du socket «s» en écoute sur (ip, port)
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -251,87 +1686,206 @@ window.addEventListener("DOMContentLoaded", () => commande_api("/__init", "locat
 
     print('Démarrage du serveur http://' + ip + ':' + str(port))
 
-    # boucle du serveur : accepte les connexions sur s et y répond
+    # les connexions ouvertes attendent leur prochaine requête dans le sélecteur, avec le socket d'écoute,
+    # pour qu'un client inactif ne bloque pas les autres
+    sel = selectors.DefaultSelector()
+    sel.register(s, selectors.EVENT_READ)
+    # socket -> état de la connexion (octets reçus, longueur déjà parcourue sans trouver la fin d'une requête,
+    # requêtes servies, dernière activité, occupée, flux ouvert par la page et sa fonction d'écriture,
+    # arrivée du premier octet de la requête en cours si les métriques sont actives)
+    connexions = {}
+    # secondes laissées à un client pour envoyer (ou recevoir) une requête
+    délai_requête = 5
+
+    # avec des travailleurs, les requêtes sont traitées en parallèle ; les connexions servies reviennent
+    # par la file «rendues», et le socket «réveil» interrompt l'attente du sélecteur
+    rendues = queue.SimpleQueue()
+    groupe = None
+    if travailleurs > 0:
+        groupe = concurrent.futures.ThreadPoolExecutor(travailleurs)
+        réveil, réveil_envoi = socket.socketpair()
+        sel.register(réveil, selectors.EVENT_READ)
+
+    # boucle du serveur : accepte les connexions sur s et répond aux requêtes qui arrivent
     while _continuer and max_conn != 0:
-        # on accepte la connexion
-        t, (h, p) = s.accept()
+        for clé, _ in sel.select(timeout=min(keep_alive, 1) if keep_alive > 0 else 1):
+            if clé.fileobj is s:
+                # on accepte la connexion
+                t, _ = s.accept()
+                t.settimeout(délai_requête)
+                sel.register(t, selectors.EVENT_READ)
+                connexions[t] = {
+                    'reçu': bytearray(),
+                    'vu': 0,
+                    'requêtes': 0,
+                    'activité': time.monotonic(),
+                    'occupée': False,
+                    'flux': None,
+                    'arrivée': 0.0,
+                }
+                continue
+
+            if groupe is not None and clé.fileobj is réveil:
+                réveil.recv(4096)
+                continue
+
+            t = clé.fileobj
+            if t not in connexions or connexions[t]['occupée']:
+                continue  # fermée ou confiée à un travailleur pendant ce tour
+            try:
+                reçu = t.recv(65536)
+            except OSError:
+                reçu = b''
+            if not reçu:  # le client a fermé la connexion
+                fermer(t)
+                continue
+            if connexions[t]['flux'] is not None:
+                continue  # rien n'est attendu d'une page sur son flux
+            if _métriques is not None and not connexions[t]['reçu']:
+                connexions[t]['arrivée'] = time.perf_counter()
+            connexions[t]['reçu'] += reçu
+            connexions[t]['activité'] = time.monotonic()
+            lancer(t)
+
+        reprendre()
+
+        # on ferme les connexions restées inactives trop longtemps
+        # (une connexion qui n'a encore rien demandé dispose de délai_requête secondes)
+        maintenant = time.monotonic()
+        for t in [
+            t
+            for t, état in connexions.items()
+            if not état['occupée']
+            and état['flux'] is None
+            and maintenant - état['activité']
+            > (keep_alive if état['requêtes'] else délai_requête)
+        ]:
+            fermer(t)
+
+    if groupe is not None:
+        groupe.shutdown()
+        reprendre()
+        sel.unregister(réveil)
+        réveil.close()
+        réveil_envoi.close()
+    for t in list(connexions):
+        fermer(t)
+    sel.close()
+    #    s.shutdown(socket.SHUT_RDWR)
+    s.close()
+
 
-        # on filtre les flux
-        t.settimeout(0.05)
+async def servir_async(
+    ip: str = '127.0.0.1',
+    port: int = 5080,
+    keep_alive: float = 5,
+    max_requêtes: int = 100,
+) -> None:
+    """
+    coroutine démarrant un serveur asyncio sur le port 'port' de l'interface 'ip' : asyncio.run(servir_async())
+    les fonctions associées aux api et aux battements peuvent être des coroutines, attendues sans bloquer les autres clients
+    keep_alive et max_requêtes : comme pour servir
+    """
 
+    async def servir_connexion(
+        lecteur: asyncio.StreamReader, écrivain: asyncio.StreamWriter
+    ) -> None:
+        """
+        répond aux requêtes successives d'une connexion, jusqu'à sa fermeture
+        """
+        requêtes = 0
         try:
-            req = t.recv(2048)
-        except socket.timeout:
-            pass
-        #            print ('Timeout !')
-        except:
+            while _continuer:
+                try:
+                    req = await asyncio.wait_for(
+                        lecteur.readuntil(b'\r\n\r\n'),
+                        keep_alive if requêtes and keep_alive > 0 else délai_requête,
+                    )
+                except asyncio.LimitOverrunError:
+                    écrivain.write(
+                        _erreur(
+                            '431 Request Header Fields Too Large',
+                            'Requête trop longue !',
+                        )
+                    )
+                    await écrivain.drain()
+                    break
+                except (TimeoutError, asyncio.IncompleteReadError, OSError):
+                    break
+                chrono = None
+                if _métriques is not None:
+                    # la réception n'est pas mesurée : readuntil attend aussi la requête suivante
+                    chrono = _Chrono()
+                    début = time.perf_counter()
+                    _chrono.set(chrono)
+                requête = _analyser(req[:-4])
+                if chrono is not None:
+                    chrono.noter('analyse', début)
+                requêtes += 1
+                garder = _garder(requête, requêtes, keep_alive, max_requêtes)
+                try:
+                    réponse = await _répondre_async(
+                        requête, _entête_connexion(garder, keep_alive, max_requêtes)
+                    )
+                except Exception:
+                    garder = False
+                    réponse = _erreur_interne()
+                if chrono is not None:
+                    chrono.relever(réponse)
+                    envoi = time.perf_counter()
+                if isinstance(réponse, _Flux):
+                    if chrono is not None:
+                        _clore_relevé(chrono, début)
+                    await servir_flux(réponse, lecteur, écrivain)
+                    break
+                if isinstance(réponse, _Envoi):
+                    await réponse.envoyer_async(écrivain)
+                else:
+                    écrivain.write(réponse)
+                await écrivain.drain()
+                if chrono is not None:
+                    chrono.noter('envoi', envoi)
+                    _clore_relevé(chrono, début)
+                if not garder:
+                    break
+        except OSError:
             pass
-        #            print ('Autre...')
-        else:
-            #            print('succès')
+        finally:
+            écrivain.close()
 
-            max_conn = min(max_conn, max(max_conn - 1, 0))
-            t.shutdown(socket.SHUT_RD)
-
-            query = req.split(b'\r\n', 1)[0]
-            elts = query.split(b' ')
+    async def servir_flux(
+        flux: _Flux, lecteur: asyncio.StreamReader, écrivain: asyncio.StreamWriter
+    ) -> None:
+        """
+        garde ouvert le flux d'une page jusqu'à son départ ; les actions y sont écrites depuis n'importe quel fil d'exécution
+        """
+        boucle = asyncio.get_running_loop()
 
-            if elts[0] == b'GET':
-                url = elts[1].split(b'?', 1)
-                comm = pourcent_dec_get((url[0]))
-                if len(url) == 1:
-                    param = ''
-                else:
-                    param = pourcent_dec_get(url[1])
-                params = extraire(param)
-
-                # ordre de traitement : js intégré, tictac, touches, api, init, fichier
-                if comm == chemin_js:
-                    contenu = bytes(interlocuteur_js(), 'utf-8')
-                    paquet = empaqueter(contenu, 'js')
-                elif comm == '/__tictac':
-                    if len(_battements) > int(params['ref']):
-                        _battements[int(params['ref'])][0]()
-                    contenu = bytes(json.dumps(_actions), 'utf-8')
-                    _actions = {}
-                    paquet = empaqueter(contenu, 'json')
-                elif comm in _catalogue:
-                    _catalogue[comm](comm, params)
-                    contenu = bytes(json.dumps(_actions), 'utf-8')
-                    _actions = {}
-                    paquet = empaqueter(contenu, 'json')
-                elif (
-                    comm == '/__init'
-                ):  # placé après le catalogue pour pouvoir court-circuiter
-                    contenu = bytes(json.dumps(_actions), 'utf-8')
-                    _actions = {}
-                    paquet = empaqueter(contenu, 'json')
-                else:  # on cherche le fichier
-                    comm = '.' + comm
-                    paquet = gen_fichier(
-                        comm
-                    )  # la fonction gen_fichier se charge de générer le 404 si elle ne trouve pas le fichier
-                t.sendall(paquet)
-
-            else:  # ce n'est pas une requête GET
-                t.sendall(
-                    bytes(
-                        'HTTP/1.1 400 Bad Request\r\nContent-Type: text/plain; charset=utf-8\r\nConnection: close\r\nContent-Length: 26\r\n\r\nRequête mal formée !\r\n\r\n',
-                        'utf-8',
-                    )
-                )
+        def écrire(données: bytes) -> None:
+            boucle.call_soon_threadsafe(écrivain.write, données)
 
+        if not flux.brancher(écrire):
+            await asyncio.sleep(0)  # laisse partir les écritures programmées
+            return
         try:
-            t.shutdown(socket.SHUT_WR)
-            #            print ("Bye 1")
-            t.close()
-        #            print ("Bye 2")
-        except:
-            #            print('except shutdown')
-            pass
-
-    #    s.shutdown(socket.SHUT_RDWR)
-    s.close()
+            while _continuer and not lecteur.at_eof():
+                try:
+                    await asyncio.wait_for(lecteur.read(1024), 1)
+                except TimeoutError:
+                    pass
+        finally:
+            flux.débrancher(écrire)
+
+    # secondes laissées à un client pour envoyer une requête
+    délai_requête = 5
+
+    serveur = await asyncio.start_server(
+        servir_connexion, ip, port, limit=_TAILLE_MAX_REQUÊTE
+    )
+    print('Démarrage du serveur http://' + ip + ':' + str(port))
+    async with serveur:
+        while _continuer:
+            await asyncio.sleep(0.2)
 
 
 def stop() -> None:
@@ -365,7 +1919,8 @@ def charge_page(page: str, comm_init: callable = None) -> None:
     Programme la redirection de la page html affichée vers «page» au prochain appel d'une api.
     Facultatif : comm_init indique l'api à appeler au chargement de la page cible.
     """
-    _actions['propage'] = page
+    actions = _tampon()
+    actions['propage'] = page
     if not comm_init == None:
         api('/__init', comm_init)
 
@@ -373,17 +1928,27 @@ def charge_page(page: str, comm_init: callable = None) -> None:
 def def_battement(tempo: int, commande: callable) -> int:
     """
     programme un appel de «commande» tous les «tempo» millisecondes via le javascript de la page
+    (en mode flux, par le serveur lui-même, qui pousse les actions à la page)
     les actions engagées par «commande» sont exécutées sur la page
     la valeur renvoyée est un identifiant du battement à utiliser pour le désactiver/le réactiver
     """
-    if 'créer_batt' not in _actions:
-        _actions['créer_batt'] = {}
+    actions = _tampon()
 
-    ref = len(_battements)
+    ref = next(_refs)
 
-    _battements.append((commande, tempo))
+    session = _session.get()
+    if session is not None and session.ident:
+        session.battements[ref] = [commande, tempo, True]
+        if _flux:
+            _programmer(session, ref, time.monotonic() + tempo / 1000)
+            return ref
+    else:
+        _battements[ref] = [commande, tempo, True]
+
+    if 'créer_batt' not in actions:
+        actions['créer_batt'] = {}
 
-    _actions['créer_batt'][str(ref)] = tempo
+    actions['créer_batt'][str(ref)] = tempo
 
     return ref
 
@@ -392,12 +1957,24 @@ def état_battement(ref: int, actif: bool) -> None:
     """
     active_désactive le battement «ref»
     """
+    session = _session.get()
+    battements = (
+        session.battements if session is not None and session.ident else _battements
+    )
+    if ref not in battements:
+        return
+    battements[ref][2] = actif
+    if _flux and battements is not _battements:  # battement exécuté par le serveur
+        return
+    actions = _tampon()
     if actif:
-        _actions['créer_batt'][str(ref)] = _battements[ref][1]
+        if 'créer_batt' not in actions:
+            actions['créer_batt'] = {}
+        actions['créer_batt'][str(ref)] = battements[ref][1]
     else:
-        if 'stop_batt' not in _actions:
-            _actions['stop_batt'] = []
-            _actions['stop_batt'].append(ref)
+        if 'stop_batt' not in actions:
+            actions['stop_batt'] = []
+        actions['stop_batt'].append(ref)
 
 
 # def écouter_touches( activé : bool, comm : str, fnct : callable) -> None:
@@ -406,14 +1983,15 @@ def écouter_touches(**kwargs) -> None:
     écouter_touches( activé : bool, comm : str, fnct : callable = lambda c,p: None) -> None:
     écouter les touches du clavier
     """
+    actions = _tampon()
 
     activé = kwargs['activé'] if 'activé' in kwargs else True
     comm = kwargs['comm'] if 'comm' in kwargs else ('/__ec.to__')
     fnct = kwargs['fnct'] if 'fnct' in kwargs else lambda c, p: None
 
-    _actions['écouter_touches'] = activé and len(comm) > 0
+    actions['écouter_touches'] = activé and len(comm) > 0
     if activé and len(comm) > 0:
-        _actions['comm_touches'] = comm
+        actions['comm_touches'] = comm
         api(comm, fnct)
 
 
@@ -422,15 +2000,16 @@ def capture_clic(objet: str, **kwargs) -> None:
     capture_clic(objet : str, activé : bool,  comm : str, fnct : callable = lambda c,p:None)
     définit l'événement onclick de l'objet
     """
+    actions = _tampon()
 
     activé = kwargs['activé'] if 'activé' in kwargs else True
     comm = kwargs['comm'] if 'comm' in kwargs else ('/__cc__.' + objet)
     fnct = kwargs['fnct'] if 'fnct' in kwargs else lambda c, p: None
 
-    if 'capture_clic' not in _actions:
-        _actions['capture_clic'] = []
+    if 'capture_clic' not in actions:
+        actions['capture_clic'] = []
 
-    _actions['capture_clic'].append([activé, objet, comm])
+    actions['capture_clic'].append([activé, objet, comm])
 
     if activé and len(comm) > 0:
         api(comm, fnct)
@@ -440,45 +2019,97 @@ def classes(objet: str, classes: str) -> None:
     """
     Pour insérer dans le dictionnaire _actions les éléments permettant de fixer la classe de l'objet d'id «objet» à «valeur»
     """
-    if not 'classes' in _actions:
-        _actions['classes'] = {}
-    _actions['classes'][objet] = classes
+    actions = _tampon()
+    if not 'classes' in actions:
+        actions['classes'] = {}
+    actions['classes'][objet] = classes
 
 
 def lier_param(objet: str, paramètre: str) -> None:
     """
     Pour que la valeur de l'attribut «value» de l'objet d'id «objet» soit donnée au paramètre «paramètre» de chaque appel d'api (événements et tic-tacs inclus)
     """
-    if not 'params' in _actions:
-        _actions['params'] = {}
-    _actions['params'][objet] = paramètre
+    actions = _tampon()
+    if not 'params' in actions:
+        actions['params'] = {}
+    actions['params'][objet] = paramètre
 
 
 def valeur(objet: str, value: str) -> None:
     """
     Pour insérer dans le dictionnaire _actions les éléments permettant de fixer l'attribut value de l'objet d'id «objet» à «value»
     """
-    if not 'valeurs' in _actions:
-        _actions['valeurs'] = {}
-    _actions['valeurs'][objet] = value
+    actions = _tampon()
+    if not 'valeurs' in actions:
+        actions['valeurs'] = {}
+    actions['valeurs'][objet] = value
 
 
 def contenu(objet: str, contenu: str, alasuite=False) -> None:
     """
     Pour insérer dans le dictionnaire _actions les éléments permettant de fixer le contenu de l'objet d'id «objet» à «valeur»
     """
+    actions = _tampon()
     if alasuite:
         motclé = 'alasuite'
-        if not motclé in _actions:
-            _actions[motclé] = {}
-        if not objet in _actions[motclé]:
-            _actions[motclé][objet] = []
-        _actions[motclé][objet].append(contenu)
+        if not motclé in actions:
+            actions[motclé] = {}
+        if not objet in actions[motclé]:
+            actions[motclé][objet] = []
+        actions[motclé][objet].append(contenu)
     else:
         motclé = 'contenu'
-        if not motclé in _actions:
-            _actions[motclé] = {}
-        _actions[motclé][objet] = contenu
+        if not motclé in actions:
+            actions[motclé] = {}
+        actions[motclé][objet] = contenu
+
+
+def indexer(nom: str, sélecteur: str) -> None:
+    """
+    Nomme «nom» la liste des objets de la page désignés par «sélecteur», dans l'ordre du document,
+    pour que cellule() les désigne par leur rang ; la page recalcule la liste après chaque changement de contenu.
+    """
+    actions = _tampon()
+    if not 'index' in actions:
+        actions['index'] = {}
+    actions['index'][nom] = sélecteur
+
+
+def cellule(
+    nom: str, rang: int, contenu: str | None = None, classes: str | None = None
+) -> None:
+    """
+    Change le contenu et/ou l'attribut class (None : inchangé) de l'objet de rang «rang» dans la liste «nom» (voir indexer).
+    Plusieurs changements d'une même cellule dans une réponse n'en font qu'un.
+    """
+    actions = _tampon()
+    if not 'cellules' in actions:
+        actions['cellules'] = {}
+    cellules = actions['cellules'].setdefault(nom, {})
+    ancien = cellules.get(rang, (None, None))
+    cellules[rang] = [
+        ancien[0] if contenu is None else contenu,
+        ancien[1] if classes is None else classes,
+    ]
+
+
+def régler_actions(coalescer: bool = True, mesurer: bool = False) -> None:
+    """
+    coalescer : réunir en un seul sélecteur les sélecteurs consécutifs d'une réponse qui reçoivent la même valeur
+    mesurer : compter les octets d'actions envoyés avant et après compactage (voir mesures_actions)
+    """
+    global _coalescer, _mesurer
+    _coalescer = coalescer
+    _mesurer = mesurer
+
+
+def mesures_actions() -> dict:
+    """
+    Renvoie le nombre de réponses et d'événements mesurés, et leurs octets d'actions avant et après compactage
+    (sélecteurs regroupés, cellules aplaties), depuis l'appel de régler_actions(mesurer=True).
+    """
+    with _verrou:
+        return dict(_mesures)
 
 
 def init_page(fnct: callable = lambda c, p: None) -> None:
@@ -488,6 +2119,116 @@ def init_page(fnct: callable = lambda c, p: None) -> None:
     api('/__init', fnct)
 
 
+def def_état(fabrique: callable) -> None:
+    """
+    Définit la fonction (sans paramètre) appelée pour créer l'état de chaque nouvelle session.
+    """
+    global _fabrique_état
+    _fabrique_état = fabrique
+
+
+def session() -> Session:
+    """
+    Renvoie la session de la requête en cours (ou celle choisie par dans_session), None hors requête.
+    """
+    return _session.get()
+
+
+def état() -> object:
+    """
+    Renvoie l'état de la session de la requête en cours, créé par la fonction donnée à def_état.
+    """
+    return _session.get().état
+
+
+@contextlib.contextmanager
+def dans_session(session: Session):
+    """
+    Les actions engagées dans ce bloc with sont destinées à la session «session» (hors requête, ou depuis la requête
+    d'une autre session) : elles lui sont poussées par son flux en mode flux, sinon transmises avec sa prochaine réponse.
+    """
+    jeton = _session.set(session)
+    jeton_tampon = _en_cours.set({})
+    try:
+        yield session
+    finally:
+        actions = _en_cours.get()
+        _en_cours.reset(jeton_tampon)
+        _session.reset(jeton)
+        with _verrou:
+            _fusionner(session.actions, actions)
+        _pousser(session)
+
+
+def régler_flux(actif: bool = True) -> None:
+    """
+    Active (ou désactive) le mode flux pour les pages initialisées ensuite : la page ouvre un flux Server-Sent Events
+    sur lequel le serveur lui pousse les actions dès qu'elles sont engagées, et les battements sont exécutés
+    par le serveur au lieu d'être des appels répétés de la page.
+    """
+    global _flux
+    _flux = actif
+
+
+def régler_cache(budget: int = 8 * 1024 * 1024) -> None:
+    """
+    Fixe le nombre d'octets au plus occupés en mémoire par le cache des fichiers servis (0 : pas de cache).
+    Les fichiers les moins récemment servis sont oubliés en premier ; un fichier modifié sur le disque est relu.
+    """
+    global _budget_cache
+    _budget_cache = budget
+    with _verrou_cache:
+        _purger_cache()
+
+
+def régler_métriques(actif: bool = True) -> None:
+    """
+    Active (en repartant de zéro) ou désactive la mesure des requêtes : durées par route et par étape
+    (réception, analyse, appel de la fonction, sérialisation des actions, envoi, total), requêtes par statut,
+    erreurs et octets envoyés. Les mesures sont publiées sur le chemin /__metriques au format texte de Prometheus.
+    Désactivée, la mesure ne coûte qu'un test par étape.
+    """
+    global _métriques
+    _métriques = _Métriques() if actif else None
+
+
+def métriques() -> str:
+    """
+    Renvoie le texte publié sur /__metriques (vide si la mesure des requêtes n'est pas active).
+    """
+    métriques = _métriques
+    return '' if métriques is None else métriques.texte()
+
+
+def régler_profilage(
+    seuil: float = 0.1, dossier: str = 'profiles', période: int = 100, garder: int = 50
+) -> None:
+    """
+    Active le profilage des appels d'api lents (fonctions associées par api, init_page, capture_clic...) :
+    un appel sur «période» est exécuté sous cProfile, et tout appel qui dure au moins «seuil» secondes laisse
+    dans «dossier» un relevé .json (chemin, paramètres, durée) et, s'il a été profilé, ses statistiques .prof
+    (python -m pstats dossier/....prof). Seuls les «garder» relevés les plus récents sont conservés.
+    Un appel profilé est nettement ralenti : n'en profiler qu'un sur «période» garde la latence des autres intacte.
+    Un seuil négatif ou nul désactive le profilage.
+    """
+    global _profilage
+    _profilage = _Profilage(seuil, dossier, période, garder) if seuil > 0 else None
+
+
+def régler_sessions(maximum: int = 1000, durée: float = 1800) -> None:
+    """
+    Fixe le nombre maximal de sessions gardées en mémoire (les moins récemment servies sont oubliées en premier)
+    et la durée en secondes au bout de laquelle une session sans activité est oubliée
+    (en mode flux, une session dont la page garde le flux ouvert reste active).
+    Une page dont la session a été oubliée est rechargée à son appel suivant.
+    """
+    global _max_sessions, _durée_session
+    _max_sessions = maximum
+    _durée_session = durée
+    with _verrou:
+        _purger_sessions(time.monotonic())
+
+
 if __name__ == '__main__':
     # lance un serveur web de base
     # attention, il insère son script dans les pages .html
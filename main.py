@@ -1,34 +1,36 @@
-import copy
+import argparse
+import functools
+import itertools
 import random
-from typing import Any, Optional
+from typing import Any, Callable, Iterator, Optional
 
 import htinter as ht
+from board import Board
+from canon import SeedSet, SolutionCache
+from corpus import Corpus
+from grader import grade
+from grid import ALL_DIGITS, CELL_BOX, CELL_COL, CELL_ROW, PEERS, UNITS, FlatGrid
+from pool import PuzzlePool
+from view import EMPTY, GIVEN, GridView
 
 
-type Grid = list[list[int]]
+type Grid = FlatGrid
 
 
 def is_valid(grid: Grid, row: int, col: int, num: int) -> bool:
-    if any(grid[row][i] == num or grid[i][col] == num for i in range(9)):
-        return False
-
-    box_row, box_col = (row // 3) * 3, (col // 3) * 3
-    return all(
-        grid[r][c] != num
-        for r in range(box_row, box_row + 3)
-        for c in range(box_col, box_col + 3)
-    )
+    cells = grid.cells
+    i = row * 9 + col
+    return cells[i] != num and all(cells[p] != num for p in PEERS[i])
 
 
 def find_empty_location(grid: Grid) -> Optional[tuple[int, int]]:
-    for i in range(9):
-        for j in range(9):
-            if grid[i][j] == 0:
-                return i, j
-    return None
+    i = grid.cells.find(0)
+    if i == -1:
+        return None
+    return i // 9, i % 9
 
 
-def solve_sudoku(grid: Grid) -> bool:
+def solve_sudoku_backtracking(grid: Grid) -> bool:
     loc = find_empty_location(grid)
     if not loc:
         return True
@@ -36,48 +38,542 @@ def solve_sudoku(grid: Grid) -> bool:
     row, col = loc
     for num in range(1, 10):
         if is_valid(grid, row, col, num):
-            grid[row][col] = num
-            if solve_sudoku(grid):
+            grid.cells[row * 9 + col] = num
+            if solve_sudoku_backtracking(grid):
                 return True
-            grid[row][col] = 0
+            grid.cells[row * 9 + col] = 0
     return False
 
 
-def fill_grid(grid: Grid) -> bool:
-    for i in range(9):
-        for j in range(9):
-            if grid[i][j] == 0:
-                nums = list(range(1, 10))
-                random.shuffle(nums)
-                for num in nums:
-                    if is_valid(grid, i, j, num):
-                        grid[i][j] = num
-                        if fill_grid(grid):
-                            return True
-                        grid[i][j] = 0
+class BitmaskSolver:
+    # Keeps one bitmask of used digits per row, column and box so the
+    # candidates of a cell are three ORs away instead of 27 cell reads.
+    __slots__ = ('cells', 'rows', 'cols', 'boxes', 'budget')
+
+    def __init__(self) -> None:
+        self.cells = [0] * 81
+        self.rows = [0] * 9
+        self.cols = [0] * 9
+        self.boxes = [0] * 9
+        self.budget: Optional[int] = None
+
+    def load(self, grid: Grid) -> bool:
+        for i, num in enumerate(grid.cells):
+            if num == 0:
+                continue
+            bit = 1 << (num - 1)
+            if (
+                self.rows[CELL_ROW[i]]
+                | self.cols[CELL_COL[i]]
+                | self.boxes[CELL_BOX[i]]
+            ) & bit:
                 return False
+            self.place(i, bit)
+        return True
+
+    def candidates(self, i: int) -> int:
+        return (
+            ~(self.rows[CELL_ROW[i]] | self.cols[CELL_COL[i]] | self.boxes[CELL_BOX[i]])
+            & ALL_DIGITS
+        )
+
+    def place(self, i: int, bit: int) -> None:
+        self.cells[i] = bit.bit_length()
+        self.rows[CELL_ROW[i]] |= bit
+        self.cols[CELL_COL[i]] |= bit
+        self.boxes[CELL_BOX[i]] |= bit
+
+    def unplace(self, i: int) -> None:
+        bit = ~(1 << (self.cells[i] - 1))
+        self.cells[i] = 0
+        self.rows[CELL_ROW[i]] &= bit
+        self.cols[CELL_COL[i]] &= bit
+        self.boxes[CELL_BOX[i]] &= bit
+
+    def propagate(self, trail: list[int]) -> Optional[list[tuple[int, int]]]:
+        # Fills naked and hidden singles until a fixpoint. Returns the
+        # (cell, bit) alternatives to branch on, [] when solved and None on
+        # a contradiction. Like DLX, it branches on the smallest choice:
+        # the digits of the most constrained cell, or the places left for
+        # a digit in one of its units.
+        cells = self.cells
+        while True:
+            best, best_count, progress = -1, 10, False
+            for i in range(81):
+                if cells[i]:
+                    continue
+                mask = self.candidates(i)
+                if not mask:
+                    return None
+                count = mask.bit_count()
+                if count == 1:
+                    self.place(i, mask)
+                    trail.append(i)
+                    progress = True
+                elif count < best_count:
+                    best, best_count = i, count
+            if progress:
+                continue
+            if best == -1:
+                return []
+
+            # places[k]: the empty cells of the unit where digit k fits;
+            # only worth collecting when no cell is down to two digits
+            spread: Optional[tuple[int, list[int]]] = None
+            for unit in UNITS:
+                once = twice = used = 0
+                places: list[list[int]] = [[] for _ in range(9)]
+                for i in unit:
+                    if cells[i]:
+                        used |= 1 << (cells[i] - 1)
+                        continue
+                    mask = self.candidates(i)
+                    twice |= once & mask
+                    once |= mask
+                    if best_count > 2:
+                        while mask:
+                            bit = mask & -mask
+                            mask ^= bit
+                            places[bit.bit_length() - 1].append(i)
+                if (once | used) != ALL_DIGITS:
+                    return None
+                singles = once & ~twice
+                while singles:
+                    bit = singles & -singles
+                    singles ^= bit
+                    for i in unit:
+                        if not cells[i] and self.candidates(i) & bit:
+                            self.place(i, bit)
+                            trail.append(i)
+                            progress = True
+                            break
+                if best_count > 2 and not progress:
+                    for k, where in enumerate(places):
+                        if (
+                            1
+                            < len(where)
+                            < (best_count if spread is None else len(spread[1]))
+                        ):
+                            spread = (1 << k, where)
+            if progress:
+                continue
+            if spread is not None:
+                bit, where = spread
+                return [(i, bit) for i in where]
+            mask = self.candidates(best)
+            choices = []
+            while mask:
+                bit = mask & -mask
+                mask ^= bit
+                choices.append((best, bit))
+            return choices
+
+    def search(self) -> bool:
+        trail: list[int] = []
+        choices = self.propagate(trail)
+        if choices == []:
+            return True
+        for i, bit in choices or ():
+            self.place(i, bit)
+            if self.search():
+                return True
+            self.unplace(i)
+        for j in reversed(trail):
+            self.unplace(j)
+        return False
+
+    def count(self, limit: int) -> int:
+        # Like search() but always restores the state it started from.
+        # With a budget set, each node spends one and the count stops
+        # short once it runs out, leaving the budget negative.
+        if self.budget is not None:
+            self.budget -= 1
+            if self.budget < 0:
+                return 0
+        trail: list[int] = []
+        choices = self.propagate(trail)
+        found = 1 if choices == [] else 0
+        for i, bit in choices or ():
+            if found >= limit:
+                break
+            self.place(i, bit)
+            found += self.count(limit - found)
+            self.unplace(i)
+        for j in reversed(trail):
+            self.unplace(j)
+        return found
+
+
+def solve_sudoku_bitmask(grid: Grid) -> bool:
+    solver = BitmaskSolver()
+    if not solver.load(grid) or not solver.search():
+        return False
+    grid.cells[:] = bytes(solver.cells)
     return True
 
 
+class DancingLinks:
+    # Exact cover over the 324 Sudoku constraints (cell, row-digit,
+    # col-digit, box-digit), one matrix row per (cell, digit). The clues'
+    # rows are selected up front, leaving only their candidates open.
+    __slots__ = ('left', 'right', 'up', 'down', 'column', 'size', 'choice')
+    left: list[int]
+    right: list[int]
+    up: list[int]
+    down: list[int]
+    column: list[int]
+    size: list[int]
+    choice: list[tuple[int, int]]
+
+    def __init__(self, grid: Grid) -> None:
+        # Starts from a copy of the full 729-row matrix and selects the
+        # clues' rows the way the search would, which is cheaper than
+        # linking a new matrix for each puzzle. column and choice never
+        # change, so they are shared with the template.
+        full = DancingLinks.full()
+        self.left = full.left.copy()
+        self.right = full.right.copy()
+        self.up = full.up.copy()
+        self.down = full.down.copy()
+        self.size = full.size.copy()
+        self.column = full.column
+        self.choice = full.choice
+
+        covered = set()
+        for i, num in enumerate(grid.cells):
+            if not num:
+                continue
+            # the row of (i, num) starts at this node; see full()
+            row = 325 + (i * 9 + num - 1) * 4
+            for node in range(row, row + 4):
+                col = self.column[node]
+                if col in covered:
+                    # Conflicting clues: a single empty column makes every
+                    # search fail.
+                    self._clear()
+                    return
+                covered.add(col)
+                self._cover(col)
+
+    @staticmethod
+    def full() -> 'DancingLinks':
+        # The matrix of an empty grid: columns 1-324 for constraints 0-323,
+        # then one row of four nodes per (cell, digit), in that order.
+        global DLX_FULL
+        if DLX_FULL is None:
+            full = DancingLinks.__new__(DancingLinks)
+            full._reset()
+            for _ in range(324):
+                full._add_column()
+            for i in range(81):
+                r, c, b = CELL_ROW[i], CELL_COL[i], CELL_BOX[i]
+                for d in range(9):
+                    full._add_row(
+                        (i, d + 1),
+                        [
+                            1 + i,
+                            1 + 81 + r * 9 + d,
+                            1 + 162 + c * 9 + d,
+                            1 + 243 + b * 9 + d,
+                        ],
+                    )
+            DLX_FULL = full
+        return DLX_FULL
+
+    def _reset(self) -> None:
+        # just the root header
+        self.left = [0]
+        self.right = [0]
+        self.up = [0]
+        self.down = [0]
+        self.column = [0]
+        self.size = [0]
+        self.choice = [(-1, 0)]
+
+    def _clear(self) -> None:
+        self._reset()
+        self._add_column()
+
+    def _add_column(self) -> int:
+        node = len(self.left)
+        self.left.append(self.left[0])
+        self.right.append(0)
+        self.right[self.left[0]] = node
+        self.left[0] = node
+        self.up.append(node)
+        self.down.append(node)
+        self.column.append(node)
+        self.size.append(0)
+        self.choice.append((-1, 0))
+        return node
+
+    def _add_row(self, choice: tuple[int, int], columns: list[int]) -> None:
+        first = len(self.left)
+        for k, col in enumerate(columns):
+            node = first + k
+            self.left.append(first + (k - 1) % len(columns))
+            self.right.append(first + (k + 1) % len(columns))
+            self.up.append(self.up[col])
+            self.down.append(col)
+            self.down[self.up[col]] = node
+            self.up[col] = node
+            self.column.append(col)
+            self.size.append(0)
+            self.size[col] += 1
+            self.choice.append(choice)
+
+    def _cover(self, col: int) -> None:
+        left, right, up, down = self.left, self.right, self.up, self.down
+        size, column = self.size, self.column
+        right[left[col]] = right[col]
+        left[right[col]] = left[col]
+        i = down[col]
+        while i != col:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def _uncover(self, col: int) -> None:
+        left, right, up, down = self.left, self.right, self.up, self.down
+        size, column = self.size, self.column
+        i = up[col]
+        while i != col:
+            j = left[i]
+            while j != i:
+                size[column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[col]] = col
+        left[right[col]] = col
+
+    def solutions(self) -> Iterator[list[tuple[int, int]]]:
+        return self._search([])
+
+    def _search(
+        self, partial: list[tuple[int, int]]
+    ) -> Iterator[list[tuple[int, int]]]:
+        right, down, size = self.right, self.down, self.size
+        if right[0] == 0:
+            yield partial[:]
+            return
+
+        col = best = right[0]
+        while col:
+            if size[col] < size[best]:
+                best = col
+            col = right[col]
+        if size[best] == 0:
+            return
+
+        self._cover(best)
+        i = down[best]
+        while i != best:
+            j = right[i]
+            while j != i:
+                self._cover(self.column[j])
+                j = right[j]
+            partial.append(self.choice[i])
+            yield from self._search(partial)
+            partial.pop()
+            j = self.left[i]
+            while j != i:
+                self._uncover(self.column[j])
+                j = self.left[j]
+            i = down[i]
+        self._uncover(best)
+
+
+DLX_FULL: Optional[DancingLinks] = None
+
+
+def iter_solutions(grid: Grid) -> Iterator[Grid]:
+    for choices in DancingLinks(grid).solutions():
+        solution = grid.copy()
+        for i, num in choices:
+            solution.cells[i] = num
+        yield solution
+
+
+def count_solutions(grid: Grid, limit: int = 2) -> int:
+    # BitmaskSolver.count() is about 2.5 times faster than DLX on ordinary
+    # puzzles, which it settles in a few dozen nodes at most; a search that
+    # outgrows COUNT_BUDGET nodes is started over with DLX, which is the
+    # faster of the two on the hard ones.
+    solver = BitmaskSolver()
+    if not solver.load(grid):
+        return 0
+    solver.budget = COUNT_BUDGET
+    found = solver.count(limit)
+    if solver.budget >= 0:
+        return found
+    return sum(1 for _ in itertools.islice(DancingLinks(grid).solutions(), limit))
+
+
+def solution_status(grid: Grid) -> str:
+    return ('none', 'unique', 'multiple')[count_solutions(grid, limit=2)]
+
+
+def solve_sudoku_dlx(grid: Grid) -> bool:
+    solution = next(iter_solutions(grid), None)
+    if solution is None:
+        return False
+    grid.cells[:] = solution.cells
+    return True
+
+
+SOLVERS: dict[str, Callable[[Grid], bool]] = {
+    'backtracking': solve_sudoku_backtracking,
+    'bitmask': solve_sudoku_bitmask,
+    'dlx': solve_sudoku_dlx,
+}
+
+
+def solve_sudoku(grid: Grid, engine: str = 'bitmask') -> bool:
+    return SOLVERS[engine](grid)
+
+
+def fill_grid(grid: Grid) -> bool:
+    cells = grid.cells
+    i = cells.find(0)
+    if i == -1:
+        return True
+    nums = list(range(1, 10))
+    random.shuffle(nums)
+    for num in nums:
+        if all(cells[p] != num for p in PEERS[i]):
+            cells[i] = num
+            if fill_grid(grid):
+                return True
+            cells[i] = 0
+    return False
+
+
 def remove_numbers(grid: Grid, attempts: int) -> None:
+    cells = grid.cells
     while attempts > 0:
-        row, col = random.randint(0, 8), random.randint(0, 8)
-        while grid[row][col] == 0:
-            row, col = random.randint(0, 8), random.randint(0, 8)
-        grid[row][col] = 0
+        i = random.randrange(81)
+        while cells[i] == 0:
+            i = random.randrange(81)
+        cells[i] = 0
         attempts -= 1
 
 
-def generate_sudoku() -> Grid:
-    grid = [[0] * 9 for _ in range(9)]
-    fill_grid(grid)
-    remove_numbers(grid, attempts=40)
-    return grid
+def dig_holes(grid: Grid, clues: int) -> int:
+    # Removes clues in random order, keeping only the removals after which
+    # the puzzle still has a single solution. The solver state is updated
+    # in place instead of being rebuilt for every candidate removal.
+    solver = BitmaskSolver()
+    if not solver.load(grid):
+        raise ValueError('grid has conflicting clues')
+    cells = [i for i in range(81) if solver.cells[i]]
+    random.shuffle(cells)
+
+    remaining = len(cells)
+    for i in cells:
+        if remaining <= clues:
+            break
+        bit = 1 << (solver.cells[i] - 1)
+        solver.unplace(i)
+        if solver.count(2) == 1:
+            grid.cells[i] = 0
+            remaining -= 1
+        else:
+            solver.place(i, bit)
+    return remaining
+
+
+def generate_sudoku(clues: int = 41, unique: bool = True) -> tuple[Grid, Grid]:
+    # Returns the puzzle and the full grid it was dug from. A dig stops at
+    # a minimal puzzle, which may hold more than `clues` clues, so the
+    # same grid is re-dug in new orders up to DIG_ATTEMPTS times and the
+    # puzzle with the fewest clues is kept; callers that need the target
+    # met check the clue count.
+    if puzzle_seeds is not None:
+        return puzzle_seeds.derive(clues=clues)
+    solution = FlatGrid()
+    fill_grid(solution)
+    if not unique:
+        puzzle = solution.copy()
+        remove_numbers(puzzle, attempts=81 - clues)
+        return puzzle, solution
+    best, fewest = solution, 81
+    for _ in range(DIG_ATTEMPTS):
+        puzzle = solution.copy()
+        remaining = dig_holes(puzzle, clues)
+        if remaining < fewest:
+            best, fewest = puzzle, remaining
+        if remaining <= clues:
+            break
+    return best, solution
+
+
+# Clue targets for dig_holes(); advanced digs until no clue can go, which
+# is where puzzles needing more than singles show up.
+DIFFICULTY_CLUES = {'beginner': 41, 'advanced': 17}
+DIGITS = list(range(1, 10))
+COUNT_BUDGET = 50
+DIG_ATTEMPTS = 3
+GRADE_ATTEMPTS = 20
+
+
+def new_game(difficulty: str) -> tuple[Grid, Grid]:
+    if puzzle_seeds is not None and difficulty in puzzle_seeds.by_level:
+        # symmetries keep the grade, so no attempt can miss
+        return puzzle_seeds.derive(level=difficulty)
+    for _ in range(GRADE_ATTEMPTS):
+        puzzle, solution = generate_sudoku(clues=DIFFICULTY_CLUES[difficulty])
+        if grade(puzzle).level == difficulty:
+            break
+    return puzzle, solution
+
+
+def load_seeds(path: str, fmt: str = 'packed') -> SeedSet:
+    # Every seed is checked before anything is derived from it: a full,
+    # valid solution that agrees with the puzzle's clues, and a puzzle
+    # with no other solution. Digits corpora get their solutions here;
+    # every seed is graded once, for new_game to draw by difficulty.
+    seeds = []
+    with Corpus(path, fmt) as corpus:
+        for k in range(len(corpus)):
+            puzzle, solution = corpus[k]
+            if solution is None:
+                # DLX, like count_solutions: arbitrary input needs its
+                # bounded worst case
+                solution = puzzle.copy()
+                if not solve_sudoku_dlx(solution):
+                    raise ValueError(f'seed {k} has no solution')
+            if any(sorted(solution.cells[i] for i in unit) != DIGITS for unit in UNITS):
+                raise ValueError(f'seed {k} has an invalid solution')
+            if any(p and p != s for p, s in zip(puzzle.cells, solution.cells)):
+                raise ValueError(f'seed {k} does not match its solution')
+            if count_solutions(puzzle) != 1:
+                raise ValueError(f'seed {k} has more than one solution')
+            seeds.append((puzzle, solution, grade(puzzle).level))
+    return SeedSet(seeds)
+
+
+def corpus_game(corpus: Corpus) -> tuple[Grid, Grid]:
+    puzzle, solution = corpus[random.randrange(len(corpus))]
+    if solution is None:
+        # digits corpora carry no solutions; the same puzzles come back
+        # across sessions, so their solutions are cached
+        solution = puzzle.copy()
+        if solution_cache is not None:
+            solution_cache(solution)
+        else:
+            solve_sudoku(solution)
+    return puzzle, solution
 
 
 def is_valid_row(grid: Grid, row: int) -> bool:
     seen = set()
-    for num in grid[row]:
+    for num in grid.row(row):
         if num == 0:
             continue
         if num in seen:
@@ -88,8 +584,7 @@ def is_valid_row(grid: Grid, row: int) -> bool:
 
 def is_valid_col(grid: Grid, col: int) -> bool:
     seen = set()
-    for i in range(9):
-        num = grid[i][col]
+    for num in grid.col(col):
         if num == 0:
             continue
         if num in seen:
@@ -100,108 +595,152 @@ def is_valid_col(grid: Grid, col: int) -> bool:
 
 def is_valid_subgrid(grid: Grid, start_row: int, start_col: int) -> bool:
     seen = set()
-    for r in range(start_row, start_row + 3):
-        for c in range(start_col, start_col + 3):
-            num = grid[r][c]
-            if num == 0:
-                continue
-            if num in seen:
-                return False
-            seen.add(num)
+    for num in grid.box(start_row // 3 * 3 + start_col // 3):
+        if num == 0:
+            continue
+        if num in seen:
+            return False
+        seen.add(num)
     return True
 
 
-def generate_grid_dom(grid: Grid) -> None:
-    html = ('<colgroup>' + '<col>' * 3 + '</colgroup>') * 3
-    for y, row in enumerate(grid):
-        if y % 3 == 0:
-            html += '<tbody>'
-        html += '<tr>'
-        for x, num in enumerate(row):
-            cls = 'cell disabled' if num != 0 else 'cell'
-            val = str(num) if num != 0 else ''
-            html += f'<td class="{cls}" y="{y}" x="{x}">{val}</td>'
-        html += '</tr>'
-        if y % 3 == 2:
-            html += '</tbody>'
-    ht.contenu('#grid', html)
+class Game:
+    __slots__ = (
+        'sudoku_grid',
+        'solved_grid',
+        'board',
+        'clicked_cell',
+        'difficulty',
+        'view',
+    )
+
+    def __init__(self) -> None:
+        self.sudoku_grid = FlatGrid()
+        self.solved_grid = FlatGrid()
+        self.board = Board(self.sudoku_grid, self.solved_grid)
+        self.clicked_cell: Optional[dict[str, str]] = None
+        self.difficulty = 'beginner'
+        self.view = GridView()
+
+
+puzzle_pool: Optional[PuzzlePool[tuple[Grid, Grid]]] = None
+puzzle_corpus: Optional[Corpus] = None
+solution_cache: Optional[SolutionCache] = None
+# When set, new puzzles are derived from these instead of generated.
+puzzle_seeds: Optional[SeedSet] = None
+
+
+def current_game() -> Game:
+    game = ht.état()
+    assert isinstance(game, Game)
+    return game
+
+
+def show_grid(game: Game) -> None:
+    # A puzzle is only dealt by a page init, onto a blank page, so the
+    # whole table is sent; later updates go through update_cell.
+    ht.contenu('#grid', game.view.render(game.sudoku_grid))
+    ht.indexer('cells', '#grid td')
+
+
+def update_cell(
+    game: Game, i: int, text: Optional[str] = None, cls: Optional[str] = None
+) -> None:
+    change = game.view.set(i, text, cls)
+    if change is not None:
+        ht.cellule('cells', *change)
 
 
-sudoku_grid: Grid
-solved_grid: Grid
-clicked_cell: Optional[dict[str, str]] = None
-difficulty: str = 'beginner'
+def cell_class(game: Game, i: int) -> str:
+    board = game.board
+    cls = GIVEN if board.given[i] else EMPTY
+    if game.clicked_cell and i == int(game.clicked_cell['y']) * 9 + int(
+        game.clicked_cell['x']
+    ):
+        cls += ' active'
+    if i in board.marks:
+        cls += ' valid' if board.marks[i] else ' invalid'
+    if i in board.conflicts:
+        cls += ' conflict'
+    return cls
 
 
 def keyboard_event(c: Any, p: Any) -> None:
-    global sudoku_grid, clicked_cell
+    game = current_game()
 
     if p['touche'] == 'Enter':
         validate_click(None, None)
         return
 
-    if not clicked_cell:
+    if not game.clicked_cell:
         return
-    x, y = int(clicked_cell['x']), int(clicked_cell['y'])
-    cell_sel = f'.cell[x="{x}"][y="{y}"]'
+    x, y = int(game.clicked_cell['x']), int(game.clicked_cell['y'])
+    i = y * 9 + x
 
+    flipped: set[int] = set()
     if p['touche'].isdigit():
-        sudoku_grid[y][x] = int(p['touche'])
-        ht.contenu(cell_sel, p['touche'])
+        flipped = game.board.set(i, int(p['touche']))
+        update_cell(game, i, text=p['touche'])
     elif p['touche'] == 'Backspace':
-        sudoku_grid[y][x] = 0
-        ht.contenu(cell_sel, '')
+        flipped = game.board.set(i, 0)
+        update_cell(game, i, text='')
 
-    ht.classes(cell_sel, 'cell')
-    clicked_cell = None
+    game.clicked_cell = None
+    for j in flipped | {i}:
+        update_cell(game, j, cls=cell_class(game, j))
 
-    if not find_empty_location(sudoku_grid):
+    if game.board.complete:
         ht.classes('.validate', 'validate')
 
 
 def cell_click(c: Any, p: Any) -> None:
-    global clicked_cell
-    if clicked_cell:
-        prev_selector = f'.cell[x="{clicked_cell["x"]}"][y="{clicked_cell["y"]}"]'
-        ht.classes(prev_selector, 'cell')
-    clicked_cell = p
-    new_selector = f'.cell[x="{p["x"]}"][y="{p["y"]}"]'
-    ht.classes(new_selector, 'cell active')
+    game = current_game()
+    prev = game.clicked_cell
+    game.clicked_cell = p
+    if prev:
+        i = int(prev['y']) * 9 + int(prev['x'])
+        update_cell(game, i, cls=cell_class(game, i))
+    i = int(p['y']) * 9 + int(p['x'])
+    update_cell(game, i, cls=cell_class(game, i))
 
 
 def validate_click(c: Any, p: Any) -> None:
-    if difficulty == 'beginner':
-        for i in range(9):
-            for j in range(9):
-                cell_sel = f'.cell[x="{j}"][y="{i}"]:not(.disabled)'
-                if sudoku_grid[i][j] != 0:
-                    if sudoku_grid[i][j] == solved_grid[i][j]:
-                        ht.classes(cell_sel, 'cell valid')
-                    else:
-                        ht.classes(cell_sel, 'cell invalid')
+    game = current_game()
+    if game.difficulty == 'beginner':
+        for i in game.board.validate():
+            update_cell(game, i, cls=cell_class(game, i))
 
 
 def difficulty_click(c: Any, p: Any) -> None:
-    global difficulty
+    game = current_game()
     if p['class'].split()[1] == 'beginner':
-        difficulty = 'advanced'
+        game.difficulty = 'advanced'
         ht.classes('.validate', 'validate disabled')
     else:
-        difficulty = 'beginner'
+        game.difficulty = 'beginner'
         ht.classes('.validate', 'validate')
-    ht.classes('.difficulty', 'difficulty ' + difficulty)
+    ht.classes('.difficulty', 'difficulty ' + game.difficulty)
 
 
 def main(c: Any, p: Any) -> None:
-    global sudoku_grid, solved_grid
-    sudoku_grid = generate_sudoku()
+    game = current_game()
+    # a reloaded page keeps its session: start from a blank page, but
+    # deal at the difficulty chosen before the reload
+    game.view = GridView()
+    game.clicked_cell = None
+    ht.classes('.difficulty', 'difficulty ' + game.difficulty)
+    if game.difficulty == 'advanced':
+        ht.classes('.validate', 'validate disabled')
+    if puzzle_corpus is not None:
+        game.sudoku_grid, game.solved_grid = corpus_game(puzzle_corpus)
+    elif puzzle_pool is not None:
+        game.sudoku_grid, game.solved_grid = puzzle_pool.get(game.difficulty)
+    else:
+        game.sudoku_grid, game.solved_grid = new_game(game.difficulty)
 
-    while True:
-        solved_grid = copy.deepcopy(sudoku_grid)
-        if solve_sudoku(solved_grid):
-            break
+    game.board = Board(game.sudoku_grid, game.solved_grid)
 
-    generate_grid_dom(sudoku_grid)
+    show_grid(game)
 
     ht.écouter_touches(fnct=keyboard_event)
 
@@ -211,5 +750,66 @@ def main(c: Any, p: Any) -> None:
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pool-size', type=int, default=16)
+    parser.add_argument('--pool-low-water', type=int, default=4)
+    parser.add_argument('--pool-workers', type=int, default=1)
+    parser.add_argument('--pool-processes', action='store_true')
+    parser.add_argument('--corpus')
+    parser.add_argument('--max-sessions', type=int, default=1000)
+    parser.add_argument('--session-ttl', type=float, default=1800)
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=0,
+        help='threads serving requests in parallel (0: the server loop itself)',
+    )
+    parser.add_argument(
+        '--corpus-format', choices=('digits', 'packed'), default='packed'
+    )
+    parser.add_argument(
+        '--profile-slow',
+        type=float,
+        default=0,
+        help='profile API callbacks slower than this many ms (0: off)',
+    )
+    parser.add_argument('--seeds', help='derive new puzzles from this corpus')
+    parser.add_argument(
+        '--solution-cache',
+        type=int,
+        default=4096,
+        help='solutions kept for a digits corpus (0: off)',
+    )
+    parser.add_argument('--profile-dir', default='profiles')
+    parser.add_argument(
+        '--profile-every',
+        type=int,
+        default=100,
+        help='run one API callback in this many under cProfile',
+    )
+    args = parser.parse_args()
+
+    if args.seeds:
+        puzzle_seeds = load_seeds(args.seeds, args.corpus_format)
+
+    if args.corpus:
+        puzzle_corpus = Corpus(args.corpus, args.corpus_format)
+        if not len(puzzle_corpus):
+            parser.error(f'corpus {args.corpus} holds no puzzles')
+        if args.solution_cache > 0:
+            solution_cache = SolutionCache(solve_sudoku, args.solution_cache)
+    elif args.pool_size > 0:
+        puzzle_pool = PuzzlePool(
+            {d: functools.partial(new_game, d) for d in DIFFICULTY_CLUES},
+            size=args.pool_size,
+            low_water=args.pool_low_water,
+            workers=args.pool_workers,
+            processes=args.pool_processes,
+        )
+        puzzle_pool.start()
+
+    ht.régler_sessions(args.max_sessions, args.session_ttl)
+    ht.régler_profilage(args.profile_slow / 1000, args.profile_dir, args.profile_every)
+    ht.def_état(Game)
     ht.init_page(main)
-    ht.servir()
+    ht.servir(travailleurs=args.workers)
@@ -0,0 +1,107 @@
+import collections
+import concurrent.futures
+import functools
+import logging
+import threading
+import time
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+
+class PuzzlePool[T]:
+    # Bounded per-difficulty stock of ready puzzles. get() pops in O(1) and
+    # schedules a refill on a background executor once a stock falls below
+    # the low-water mark; a miss falls back to building one synchronously.
+
+    def __init__(
+        self,
+        factories: dict[str, Callable[[], T]],
+        size: int = 16,
+        low_water: int = 4,
+        workers: int = 1,
+        processes: bool = False,
+    ) -> None:
+        if not 0 <= low_water <= size:
+            raise ValueError('low_water must be between 0 and size')
+        self.factories = factories
+        self.size = size
+        self.low_water = low_water
+        self.stock: dict[str, collections.deque[T]] = {
+            key: collections.deque(maxlen=size) for key in factories
+        }
+        self.pending = dict.fromkeys(factories, 0)
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.failures = 0
+        self.refill_time = 0.0
+        self.refill_max = 0.0
+        self.lock = threading.Lock()
+        self.executor: concurrent.futures.Executor
+        if processes:
+            self.executor = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                workers, thread_name_prefix='puzzle-pool'
+            )
+
+    def start(self) -> None:
+        for key in self.factories:
+            self.refill(key)
+
+    def get(self, key: str) -> T:
+        with self.lock:
+            stock = self.stock[key]
+            item = stock.popleft() if stock else None
+            if item is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            low = len(stock) + self.pending[key] < self.low_water
+        if low:
+            self.refill(key)
+        return item if item is not None else self.factories[key]()
+
+    def refill(self, key: str) -> None:
+        with self.lock:
+            missing = self.size - len(self.stock[key]) - self.pending[key]
+            self.pending[key] += max(missing, 0)
+        for _ in range(missing):
+            start = time.perf_counter()
+            future = self.executor.submit(self.factories[key])
+            future.add_done_callback(functools.partial(self._store, key, start))
+
+    def _store(
+        self, key: str, start: float, future: concurrent.futures.Future[T]
+    ) -> None:
+        elapsed = time.perf_counter() - start
+        error = None if future.cancelled() else future.exception()
+        if error is not None:
+            # logged rather than dropped: the stock would otherwise just run
+            # dry while get() falls back to building puzzles inline
+            log.error('building a %s puzzle failed', key, exc_info=error)
+        with self.lock:
+            self.pending[key] -= 1
+            if error is not None:
+                self.failures += 1
+            elif not future.cancelled():
+                self.stock[key].append(future.result())
+                self.refills += 1
+                self.refill_time += elapsed
+                self.refill_max = max(self.refill_max, elapsed)
+
+    def stats(self) -> dict[str, float]:
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'refills': self.refills,
+                'failures': self.failures,
+                'refill_mean': self.refill_time / self.refills if self.refills else 0.0,
+                'refill_max': self.refill_max,
+                **{f'stock_{key}': len(stock) for key, stock in self.stock.items()},
+            }
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
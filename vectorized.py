@@ -0,0 +1,71 @@
+# Batch checks over (N, 9, 9) uint8 arrays with NumPy (optional extra:
+# pip install 'sudoku[numpy]'). Units are numbered like grid.UNITS:
+# 0-8 rows, 9-17 columns, 18-26 boxes.
+#
+# Work is done on the transposed (cells, N) layout so that every reduction
+# runs over long contiguous vectors instead of 9-element rows.
+from typing import Iterable
+
+try:
+    import numpy as np
+    import numpy.typing as npt
+except ImportError as e:
+    raise ImportError("vectorized needs NumPy: pip install 'sudoku[numpy]'") from e
+
+from corpus import Corpus
+from grid import CELL_BOX, CELL_COL, CELL_ROW, UNITS, FlatGrid
+
+UNIT_INDEX = np.array(UNITS, dtype=np.intp)
+ROW_INDEX = np.array(CELL_ROW, dtype=np.intp)
+COL_INDEX = np.array(CELL_COL, dtype=np.intp) + 9
+BOX_INDEX = np.array(CELL_BOX, dtype=np.intp) + 18
+ALL_DIGITS = np.uint16(0x1FF)
+
+
+def to_array(grids: Iterable[FlatGrid]) -> npt.NDArray[np.uint8]:
+    data = b''.join(grid.cells for grid in grids)
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, 9, 9)
+
+
+def from_corpus(
+    corpus: Corpus,
+) -> tuple[npt.NDArray[np.uint8], npt.NDArray[np.uint8] | None]:
+    records = np.frombuffer(corpus.data, dtype=np.uint8)
+    records = records[: len(corpus) * corpus.record_size]
+    records = records.reshape(-1, corpus.record_size)[:, :81]
+    if corpus.fmt == 'digits':
+        return (records - np.uint8(48)).reshape(-1, 9, 9), None
+    puzzles = records >> np.uint8(4)
+    solutions = records & np.uint8(0xF)
+    return puzzles.reshape(-1, 9, 9), solutions.reshape(-1, 9, 9)
+
+
+def _cell_bits(grids: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint16]:
+    # (81, N) digit bits: bit d for digit d + 1, 0 for blanks, and bit 9
+    # for any value above 9.
+    cells = np.minimum(grids.reshape(-1, 81).T, np.uint8(10))
+    return np.left_shift(np.uint16(1), cells, dtype=np.uint16) >> np.uint16(1)
+
+
+def validate_batch(
+    grids: npt.NDArray[np.uint8],
+) -> tuple[npt.NDArray[np.bool_], npt.NDArray[np.int8]]:
+    # A unit repeats a digit exactly when the sum of its digit bits differs
+    # from their OR. Returns per-grid validity and the first offending unit
+    # (-1 for valid grids).
+    units = _cell_bits(grids)[UNIT_INDEX]
+    used: npt.NDArray[np.uint16] = np.bitwise_or.reduce(units, axis=1)
+    bad = (units.sum(axis=1, dtype=np.uint16) != used) | (used & ~ALL_DIGITS != 0)
+    valid = ~bad.any(axis=0)
+    unit = np.where(valid, -1, bad.argmax(axis=0)).astype(np.int8)
+    return valid, unit
+
+
+def candidates_batch(grids: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint16]:
+    # Candidate bitmask (bit d for digit d + 1) of every empty cell, 0 for
+    # filled cells.
+    bits = _cell_bits(grids)
+    used: npt.NDArray[np.uint16] = np.bitwise_or.reduce(bits[UNIT_INDEX], axis=1)
+    free = ~(used[ROW_INDEX] | used[COL_INDEX] | used[BOX_INDEX]) & ALL_DIGITS
+    free[bits != 0] = 0
+    return np.ascontiguousarray(free.T).reshape(-1, 9, 9)
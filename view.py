@@ -0,0 +1,72 @@
+from typing import Optional
+
+from grid import FlatGrid
+
+# (cell index, new text, new class); None leaves that part unchanged.
+type Change = tuple[int, Optional[str], Optional[str]]
+
+GIVEN = 'cell disabled'
+EMPTY = 'cell'
+
+
+def _skeleton() -> tuple[list[str], list[int]]:
+    parts = [('<colgroup>' + '<col>' * 3 + '</colgroup>') * 3]
+    slots = []
+    for y in range(9):
+        if y % 3 == 0:
+            parts.append('<tbody>')
+        parts.append('<tr>')
+        for _ in range(9):
+            slots.append(len(parts))
+            parts.append('')
+        parts.append('</tr>')
+        if y % 3 == 2:
+            parts.append('</tbody>')
+    return parts, slots
+
+
+SKELETON, SLOTS = _skeleton()
+
+# CELL_HTML[i][num]: cell i of a freshly dealt puzzle, holding the given
+# num, or empty for 0.
+CELL_HTML = [
+    [f'<td class="{EMPTY}" y="{i // 9}" x="{i % 9}"></td>']
+    + [
+        f'<td class="{GIVEN}" y="{i // 9}" x="{i % 9}">{num}</td>'
+        for num in range(1, 10)
+    ]
+    for i in range(81)
+]
+
+
+class GridView:
+    # Mirrors the grid table last sent to the page, so later updates only
+    # carry the cells whose text or class actually changed.
+    __slots__ = ('text', 'cls')
+
+    def __init__(self) -> None:
+        self.text: list[str] = []
+        self.cls: list[str] = []
+
+    def render(self, grid: FlatGrid) -> str:
+        parts = SKELETON.copy()
+        for slot, html, num in zip(SLOTS, CELL_HTML, grid.cells):
+            parts[slot] = html[num]
+        self.text = [str(num) if num else '' for num in grid.cells]
+        self.cls = [GIVEN if num else EMPTY for num in grid.cells]
+        return ''.join(parts)
+
+    def set(
+        self, i: int, text: Optional[str] = None, cls: Optional[str] = None
+    ) -> Optional[Change]:
+        if text == self.text[i]:
+            text = None
+        if cls == self.cls[i]:
+            cls = None
+        if text is None and cls is None:
+            return None
+        if text is not None:
+            self.text[i] = text
+        if cls is not None:
+            self.cls[i] = cls
+        return i, text, cls